@@ -1,8 +1,74 @@
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from itertools import repeat
+from urllib.parse import parse_qs, urlsplit
+import codecs
+import hashlib
 import json
 import html
+import os
+import re
+import selectors
+import signal
+import socket
+import string
+import sys
+import threading
+import time
+import zipfile
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Request limits, overridable through the environment
+MAX_BODY_BYTES = int(os.environ.get('HTML_GENERATOR_MAX_BODY_BYTES', 32 * 1024 * 1024))
+MAX_LINKS = int(os.environ.get('HTML_GENERATOR_MAX_LINKS', 100000))
+# Size of each read from the request body while parsing
+READ_CHUNK_SIZE = 64 * 1024
+# Total size of rendered pages kept in the render cache
+RENDER_CACHE_BYTES = int(os.environ.get('HTML_GENERATOR_CACHE_BYTES', 64 * 1024 * 1024))
+# Batch requests (POST ?batch=1) carry many pages and get their own limits
+MAX_BATCH_BODY_BYTES = int(os.environ.get('HTML_GENERATOR_MAX_BATCH_BODY_BYTES', 256 * 1024 * 1024))
+MAX_BATCH_PAGES = int(os.environ.get('HTML_GENERATOR_MAX_BATCH_PAGES', 100000))
+# zlib level for the per-request part of gzip responses; static template
+# segments are always precompressed at level 9
+GZIP_LEVEL = int(os.environ.get('HTML_GENERATOR_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('HTML_GENERATOR_BROTLI_QUALITY', 5))
+# Worker processes rendering batch pages; 0 or 1 renders in the request thread
+BATCH_WORKERS = int(os.environ.get('HTML_GENERATOR_BATCH_WORKERS', os.cpu_count() or 1))
+# Theme packs live in one directory each under THEMES_DIR; packs are checked
+# for changes on disk at most once per reload interval (negative disables)
+THEMES_DIR = os.environ.get('HTML_GENERATOR_THEMES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'themes'))
+THEME_RELOAD_INTERVAL = float(os.environ.get('HTML_GENERATOR_THEME_RELOAD_INTERVAL', 1.0))
+DEFAULT_THEME = 'default'
+# Per-phase request timing, exposed on GET /metrics and as a Server-Timing header
+COLLECT_METRICS = os.environ.get('HTML_GENERATOR_METRICS', '').lower() in ('1', 'true', 'yes')
+SERVER_TIMING = os.environ.get('HTML_GENERATOR_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+# Open connections per standalone server process, idle keep-alive ones included
+MAX_CONNECTIONS = int(os.environ.get('HTML_GENERATOR_MAX_CONNECTIONS', 512))
 
 class handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is required for Transfer-Encoding: chunked responses
+    protocol_version = 'HTTP/1.1'
+    # Connections are closed after each response unless the server times out
+    # idle ones (see ServerHandler); otherwise one idle client could block a
+    # single-threaded server
+    keep_alive = False
+    # Responses go out as several writes; don't let Nagle hold them back
+    disable_nagle_algorithm = True
+    max_body_bytes = MAX_BODY_BYTES
+    max_links = MAX_LINKS
+    max_batch_body_bytes = MAX_BATCH_BODY_BYTES
+    max_batch_pages = MAX_BATCH_PAGES
+    collect_metrics = COLLECT_METRICS
+    server_timing = SERVER_TIMING
     
     def do_OPTIONS(self):
         """Handle CORS preflight"""
@@ -10,276 +76,898 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
         """API health check"""
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps({'status': 'ok', 'message': 'HTML Generator API is running'}).encode())
+        if urlsplit(self.path).path.rstrip('/').endswith('/metrics'):
+            self.send_metrics()
+            return
+        self.send_json(200, {
+            'status': 'ok',
+            'message': 'HTML Generator API is running',
+            'cache': RENDER_CACHE.stats()
+        })
     
     def do_POST(self):
         """Generate HTML file"""
+        headers_sent = False
+        reader = None
+        # Phase timing costs nothing unless metrics or Server-Timing are on
+        timer = PhaseTimer() if self.collect_metrics or self.server_timing else None
         try:
-            # Read request body
+            # Read and parse the request body incrementally; each link is
+            # validated as soon as it is decoded
+            query = parse_qs(urlsplit(self.path).query, keep_blank_values=True)
+            batch = read_flag(query, 'batch')
+            max_body_bytes = self.max_batch_body_bytes if batch else self.max_body_bytes
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            if content_length > max_body_bytes:
+                raise PayloadTooLarge(f'Request body exceeds {max_body_bytes} bytes')
+            reader = JSONStreamReader(self.rfile, content_length, timed=timer is not None)
             
-            # Extract data
-            heading = data.get('heading', 'Quick Links')
-            links = data.get('links', [])
-            open_in_new_tab = data.get('openInNewTab', True)
-            theme = data.get('theme', 'default') 
+            # Batch mode: many page specs in, one ZIP archive out
+            if batch:
+                compression = query.get('compression', ['deflate'])[0]
+                if compression not in ZIP_COMPRESSION:
+                    raise ValueError(f'Unknown compression: {compression}')
+                headers_sent = True
+                self.send_batch(reader, ZIP_COMPRESSION[compression])
+                return
             
-            # Validation
-            if not heading or not heading.strip():
-                raise ValueError('Heading is required')
+            # Extract and validate data
+            digests = {}
+            data = read_page_request(reader, self.max_links, timer, digests)
+            heading, links, open_in_new_tab, theme, minify = read_page_options(data)
+            if timer is not None:
+                timer.add('read', reader.read_seconds)
+                timer.lap('parse', minus=reader.read_seconds + timer.phases.get('validate', 0.0))
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
             
-            if not links or len(links) == 0:
-                raise ValueError('At least one link is required')
+            # The same normalized request always renders the same page, so its
+            # hash doubles as the ETag; each encoding is cached separately
+            cache_key = render_cache_key(heading, links, open_in_new_tab, theme, minify, digests.get('links'))
+            if encoding:
+                cache_key = f'{cache_key}-{encoding}'
+            etag = f'"{cache_key}"'
+            if timer is not None:
+                timer.lap('cache')
+            if etag_matches(etag, self.headers.get('If-None-Match')):
+                self.record_timing(timer, theme, links)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Vary', 'Accept-Encoding')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                return
             
-            # Validate each link
-            for idx, link in enumerate(links):
-                if not link.get('text') or not link.get('text').strip():
-                    raise ValueError(f'Link {idx + 1} is missing text')
-                if not link.get('url') or not link.get('url').strip():
-                    raise ValueError(f'Link {idx + 1} is missing URL')
-            
-            # Generate HTML, passing the new option
-            html_content = generate_html_page(heading, links, open_in_new_tab, theme)
+            # Generate HTML, passing the new option. The first chunk is rendered
+            # before any headers go out so early failures still become a 500.
+            cached = RENDER_CACHE.get(cache_key)
+            if cached is not None:
+                chunks = iter([cached])
+            else:
+                page = iter_html_page(heading, links, open_in_new_tab, theme, minify=minify)
+                chunks = RENDER_CACHE.fill(cache_key, encode_stream(page, encoding))
+            first_chunk = next(chunks)
+            if timer is not None:
+                timer.lap('render')
             
             # Send HTML file
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.send_header('Content-Disposition', 'attachment; filename="page.html"')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Transfer-Encoding', 'chunked')
+            if self.server_timing:
+                # Only the phases finished before the headers can be reported
+                self.send_header('Server-Timing', timer.server_timing())
             self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
+            headers_sent = True
+            out = ChunkedWriter(self)
+            out.write(first_chunk)
+            if timer is None:
+                for chunk in chunks:
+                    out.write(chunk)
+                out.close()
+            else:
+                timer.lap('write')
+                for chunk in timer.time_iter('render', chunks):
+                    out.write(chunk)
+                    timer.lap('write')
+                out.close()
+                timer.lap('write')
+                self.record_timing(timer, theme, links)
             
-        except ValueError as e:
-            # Validation errors
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
-        
         except Exception as e:
-            # Server errors
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': f'Server error: {str(e)}'}).encode())
-
-
-# --- THEME TEMPLATES ---
-# By separating templates, we can easily add more themes in the future.
-
-def get_default_theme_template():
-    # This is your original theme's HTML structure
-    return '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{safe_heading}</title>
-    <style>
-        :root {{
-            --color-background: #fcfcf9; --color-text: #13343b; --color-primary: #21808d;
-            --color-primary-hover: #1d7480; --font-family-base: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-        }}
-        @media (prefers-color-scheme: dark) {{ :root {{
-            --color-background: #1f2121; --color-text: #f5f5f5; --color-primary: #32b8c6; --color-primary-hover: #2da6b2;
-        }} }}
-        * {{ box-sizing: border-box; }} body {{ margin: 0; padding: 40px 20px; font-family: var(--font-family-base); background-color: var(--color-background); color: var(--color-text); }}
-        .container {{ max-width: 600px; margin: 0 auto; }} h1 {{ margin: 0 0 32px 0; font-size: 24px; font-weight: 600; text-align: center; }}
-        .btn {{ display: block; width: 100%; padding: 12px 16px; margin-bottom: 12px; background: var(--color-primary); color: white; border: none; border-radius: 8px; font-size: 14px; font-weight: 500; text-align: center; text-decoration: none; cursor: pointer; transition: background 0.2s; }}
-        .btn:hover {{ background: var(--color-primary-hover); }} .range-opener {{ background: rgba(var(--color-text), 0.05); border: 1px solid rgba(var(--color-text), 0.1); padding: 16px; border-radius: 8px; margin: -16px 0 32px 0; display: flex; align-items: center; gap: 12px; flex-wrap: wrap; }}
-        .range-opener label {{ font-size: 14px; font-weight: 500; color: var(--color-text); }}
-        .range-opener input[type="number"] {{ width: 70px; padding: 8px 10px; border: 1px solid rgba(var(--color-text), 0.2); background: var(--color-background); color: var(--color-text); border-radius: 6px; font-family: var(--font-family-base); font-size: 14px; text-align: center; }}
-        .range-opener .btn-open {{ padding: 8px 14px; font-size: 13px; background: var(--color-primary); color: white; border: none; border-radius: 6px; cursor: pointer; transition: background 0.2s; margin-left: auto; }}
-        .range-opener .btn-open:hover {{ background: var(--color-primary-hover); }} .range-opener > div {{ display: flex; align-items: center; gap: 8px; }}
-        @media (max-width: 600px) {{ .range-opener {{ flex-direction: column; gap: 16px; align-items: stretch; }} .range-opener .btn-open {{ margin-left: 0; }} .range-opener > div {{ justify-content: space-between; }} .range-opener input[type="number"] {{ flex: 1; }} }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>{safe_heading}</h1>
-        {range_opener_html}
-        {buttons_html}
-    </div>
-    {script_html}
-</body>
-</html>'''
-
-def get_aurora_theme_template():
-    # Aurora theme HTML structure
-    return '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{safe_heading}</title>
-    <link rel="preconnect" href="https://fonts.googleapis.com"><link rel="preconnect" href="https://fonts.gstatic.com" crossorigin><link href="https://fonts.googleapis.com/css2?family=Manrope:wght@400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        :root {{ --font-family-main: 'Manrope', sans-serif; --aurora-gradient: linear-gradient(125deg, #0d324d, #7f5a83, #c96567); --color-bg: #101118; --color-surface: rgba(255, 255, 255, 0.05); --color-surface-hover: rgba(255, 255, 255, 0.1); --color-border: rgba(255, 255, 255, 0.1); --color-text-primary: #f0f0f5; --color-text-secondary: #a0a0b0; --border-radius-lg: 16px; --border-radius-md: 12px; }}
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: var(--font-family-main); background-color: var(--color-bg); color: var(--color-text-primary); background-image: var(--aurora-gradient); background-size: 300% 300%; animation: aurora-animation 20s ease infinite; display: flex; justify-content: center; align-items: flex-start; min-height: 100vh; padding: 5vh 20px; }}
-        @keyframes aurora-animation {{ 0% {{ background-position: 0% 50%; }} 50% {{ background-position: 100% 50%; }} 100% {{ background-position: 0% 50%; }} }}
-        .container {{ width: 100%; max-width: 600px; background: var(--color-surface); backdrop-filter: blur(20px); -webkit-backdrop-filter: blur(20px); border: 1px solid var(--color-border); border-radius: var(--border-radius-lg); padding: 32px; box-shadow: 0 8px 32px rgba(0, 0, 0, 0.2); }}
-        h1 {{ font-size: 28px; font-weight: 700; text-align: center; margin-bottom: 24px; letter-spacing: 1px; }}
-        .range-opener {{ display: flex; align-items: center; gap: 16px; margin-bottom: 32px; flex-wrap: wrap; padding: 16px; background: rgba(0,0,0,0.2); border-radius: var(--border-radius-md); }}
-        .range-opener .controls {{ display: flex; flex-grow: 1; gap: 12px; align-items: center; }} .range-opener .control-group {{ display: flex; align-items: center; gap: 8px; }}
-        .range-opener label {{ font-size: 14px; color: var(--color-text-secondary); }}
-        .range-opener input[type="number"] {{ width: 55px; padding: 8px; background: transparent; border: 1px solid var(--color-border); border-radius: 8px; color: var(--color-text-primary); font-family: var(--font-family-main); font-size: 14px; text-align: center; transition: border-color 0.3s, box-shadow 0.3s; }}
-        .range-opener input[type="number"]:focus {{ outline: none; border-color: rgba(255, 255, 255, 0.5); box-shadow: 0 0 10px rgba(255, 255, 255, 0.1); }}
-        .btn-open {{ padding: 10px 18px; font-size: 14px; font-weight: 600; color: var(--color-text-primary); background: var(--aurora-gradient); background-size: 200% 200%; border: none; border-radius: 8px; cursor: pointer; transition: transform 0.2s, box-shadow 0.2s, background-position 0.5s; }}
-        .btn-open:hover {{ transform: translateY(-2px); box-shadow: 0 4px 20px rgba(0, 0, 0, 0.2); background-position: right center; }}
-        .link-list {{ display: flex; flex-direction: column; gap: 12px; }}
-        .link-item {{ display: flex; align-items: center; padding: 16px; background: transparent; border: 1px solid var(--color-border); border-radius: var(--border-radius-md); text-decoration: none; color: var(--color-text-primary); font-size: 16px; font-weight: 500; position: relative; overflow: hidden; transition: background-color 0.3s ease, transform 0.2s ease; }}
-        .link-item::before {{ content: ''; position: absolute; top: 0; right: 0; bottom: 0; left: 0; z-index: -1; margin: -2px; border-radius: inherit; background: var(--aurora-gradient); opacity: 0; transition: opacity 0.3s ease; }}
-        .link-item:hover {{ background-color: var(--color-surface-hover); transform: scale(1.02); }} .link-item:hover::before {{ opacity: 1; }}
-        .link-item .icon {{ flex-shrink: 0; width: 22px; height: 22px; margin-right: 16px; color: var(--color-text-secondary); transition: color 0.3s; }}
-        .link-item:hover .icon {{ color: var(--color-text-primary); }} .link-item .number {{ color: var(--color-text-secondary); font-weight: 400; margin-right: 8px; }}
-        @media (max-width: 550px) {{ h1 {{ font-size: 24px; }} .container {{ padding: 24px; }} .range-opener {{ flex-direction: column; align-items: stretch; }} .range-opener .controls {{ justify-content: space-between; }} .btn-open {{ width: 100%; text-align: center; justify-content: center; }} }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>{safe_heading}</h1>
-        {range_opener_html}
-        <div class="link-list">
-            {buttons_html}
-        </div>
-    </div>
-    {script_html}
-</body>
-</html>'''
-
-def get_neon_grid_theme_template():
-    # Neon Grid theme HTML structure
-    return '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{safe_heading}</title>
-    <link rel="preconnect" href="https://fonts.googleapis.com"><link rel="preconnect" href="https://fonts.gstatic.com" crossorigin><link href="https://fonts.googleapis.com/css2?family=Fira+Code:wght@400;500;600&display=swap" rel="stylesheet">
-    <style>
-        :root {{ --font-family-mono: 'Fira Code', monospace; --color-bg: #0a0a14; --color-grid: rgba(0, 255, 255, 0.1); --color-primary: #00ffff; --color-secondary: #ff00ff; --color-text: #e0e0ff; --color-text-dim: #8888aa; }}
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{ font-family: var(--font-family-mono); background-color: var(--color-bg); color: var(--color-text); background-image: linear-gradient(to right, var(--color-grid) 1px, transparent 1px), linear-gradient(to bottom, var(--color-grid) 1px, transparent 1px); background-size: 40px 40px; display: flex; justify-content: center; align-items: flex-start; min-height: 100vh; padding: 5vh 20px; overflow: hidden; position: relative; }}
-        body::before {{ content: ''; position: absolute; top: 0; left: 0; width: 100%; height: 100%; background: linear-gradient(to bottom, rgba(10, 10, 20, 0) 0%, rgba(10, 10, 20, 0.5) 50%, rgba(10, 10, 20, 0) 100%); animation: scanline 8s linear infinite; pointer-events: none; z-index: 1; }}
-        @keyframes scanline {{ 0% {{ transform: translateY(-100%); }} 100% {{ transform: translateY(100%); }} }}
-        .container {{ width: 100%; max-width: 650px; padding: 32px; background: rgba(10, 10, 20, 0.6); border: 1px solid rgba(0, 255, 255, 0.2); box-shadow: 0 0 25px rgba(0, 255, 255, 0.1); backdrop-filter: blur(4px); z-index: 2; }}
-        h1 {{ font-size: 28px; font-weight: 600; text-align: center; margin-bottom: 32px; text-transform: uppercase; letter-spacing: 3px; text-shadow: 0 0 5px #fff, 0 0 10px #fff, 0 0 20px var(--color-primary), 0 0 30px var(--color-primary); }}
-        .range-opener {{ display: flex; align-items: center; gap: 16px; margin-bottom: 32px; flex-wrap: wrap; border: 1px solid rgba(0, 255, 255, 0.2); padding: 16px; }}
-        .range-opener .controls {{ display: flex; flex-grow: 1; gap: 12px; align-items: center; }}
-        .range-opener label {{ font-size: 14px; color: var(--color-text-dim); text-transform: uppercase; }}
-        .range-opener input {{ width: 60px; padding: 8px; background: transparent; border: 1px solid var(--color-text-dim); color: var(--color-text); font-family: var(--font-family-mono); font-size: 14px; text-align: center; transition: border-color 0.3s, box-shadow 0.3s; }}
-        .range-opener input:focus {{ outline: none; border-color: var(--color-primary); box-shadow: 0 0 10px var(--color-primary); }}
-        .btn-open {{ padding: 10px 18px; font-size: 14px; font-weight: 600; font-family: var(--font-family-mono); color: var(--color-bg); background-color: var(--color-primary); border: 1px solid var(--color-primary); box-shadow: 0 0 15px var(--color-primary); text-transform: uppercase; cursor: pointer; transition: background-color 0.3s, color 0.3s, box-shadow 0.3s; }}
-        .btn-open:hover {{ background-color: transparent; color: var(--color-primary); box-shadow: 0 0 25px var(--color-primary); }}
-        .link-list {{ display: flex; flex-direction: column; gap: 16px; }}
-        .link-btn {{ position: relative; display: block; padding: 16px; border: 1px solid var(--color-primary); color: var(--color-primary); text-decoration: none; text-align: center; font-size: 16px; transition: color 0.3s, background-color 0.3s, box-shadow 0.3s; }}
-        .link-btn:hover {{ color: var(--color-bg); background-color: var(--color-primary); box-shadow: 0 0 20px var(--color-primary); }}
-        .link-btn::before, .link-btn::after {{ content: attr(data-text); position: absolute; top: 0; left: 0; width: 100%; height: 100%; background: var(--color-bg); overflow: hidden; opacity: 0; }}
-        .link-btn::before {{ padding: 16px; color: var(--color-secondary); animation: glitch-top 1s linear infinite; clip-path: polygon(0 0, 100% 0, 100% 33%, 0 33%); -webkit-clip-path: polygon(0 0, 100% 0, 100% 33%, 0 33%); }}
-        .link-btn::after {{ padding: 16px; color: var(--color-primary); animation: glitch-bottom 1.5s linear infinite; clip-path: polygon(0 67%, 100% 67%, 100% 100%, 0 100%); -webkit-clip-path: polygon(0 67%, 100% 67%, 100% 100%, 0 100%); }}
-        .link-btn:hover::before, .link-btn:hover::after {{ opacity: 1; background: transparent; }}
-        @keyframes glitch-top {{ 2%, 64% {{ transform: translate(2px, -2px); }} 4%, 60% {{ transform: translate(-2px, 2px); }} 62% {{ transform: translate(12px, -1px) skew(-13deg); }} }}
-        @keyframes glitch-bottom {{ 2%, 64% {{ transform: translate(-2px, 0); }} 4%, 60% {{ transform: translate(-2px, 0); }} 62% {{ transform: translate(-22px, 5px) skew(21deg); }} }}
-        @media (max-width: 550px) {{ h1 {{ font-size: 22px; }} .container {{ padding: 24px; }} .range-opener {{ flex-direction: column; align-items: stretch; }} .range-opener .controls {{ justify-content: space-between; }} .btn-open {{ width: 100%; text-align: center; }} }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>// {safe_heading} //</h1>
-        {range_opener_html}
-        <div class="link-list">
-            {buttons_html}
-        </div>
-    </div>
-    {script_html}
-</body>
-</html>'''
+            if headers_sent:
+                # Too late for an error status; drop the connection so the client
+                # sees a truncated body instead of a bogus complete page
+                self.close_connection = True
+                return
+            # Any unread request body would corrupt the next request
+            if reader is None or reader.remaining:
+                self.close_connection = True
+            
+            if isinstance(e, PayloadTooLarge):
+                # Size limits
+                self.send_json(413, {'error': str(e)})
+            elif isinstance(e, ValueError):
+                # Validation errors
+                self.send_json(400, {'error': str(e)})
+            else:
+                # Server errors
+                self.send_json(500, {'error': f'Server error: {str(e)}'})
+
+    def record_timing(self, timer, theme, links):
+        """Add a finished request's phase timings to the metrics"""
+        if self.collect_metrics:
+            METRICS.observe(timer, resolve_theme(theme), len(links))
+
+    def send_metrics(self):
+        """Send the metrics in Prometheus text format"""
+        if not self.collect_metrics:
+            self.send_json(404, {'error': 'Metrics are disabled'})
+            return
+        body = METRICS.exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        if self.close_connection or not self.keep_alive:
+            self.send_header('Connection', 'close')
+
+    def send_json(self, status, payload):
+        """Send a JSON response with CORS headers"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_batch(self, reader, compression):
+        """Stream a ZIP archive of the pages in a batch request"""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/zip')
+        self.send_header('Content-Disposition', 'attachment; filename="pages.zip"')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        out = ChunkedWriter(self)
+        with zipfile.ZipFile(out, 'w', compression) as archive:
+            write_batch(archive, iter_page_specs(reader, self.max_batch_pages), self.max_links)
+        out.close()
+        # A malformed body may have stopped the batch before it was fully read
+        if reader.remaining:
+            self.close_connection = True
+
+    def write_chunk(self, chunk):
+        """Write one Transfer-Encoding: chunked frame, skipping empty chunks"""
+        if chunk:
+            self.wfile.write(b'%X\r\n%s\r\n' % (len(chunk), chunk))
+
+
+class ChunkedWriter:
+    """Write-only file object sending its data as buffered HTTP chunks."""
+
+    def __init__(self, handler, buffer_size=READ_CHUNK_SIZE):
+        self.handler = handler
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        if not self.buffer and len(data) >= self.buffer_size:
+            self.handler.write_chunk(data)
+        else:
+            self.buffer += data
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.handler.write_chunk(bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        """Send what is buffered and the terminating chunk in one write."""
+        frame = b'%X\r\n%s\r\n' % (len(self.buffer), self.buffer) if self.buffer else b''
+        self.handler.wfile.write(frame + b'0\r\n\r\n')
+        self.buffer.clear()
+
+
+# --- REQUEST PARSING ---
+# Bulk payloads are parsed straight off the socket so the raw body, its
+# decoded text and the parsed links never all sit in memory at once.
+
+class PayloadTooLarge(ValueError):
+    """The request exceeds a configured size limit."""
+
+
+class JSONStreamReader:
+    """Incrementally decode a JSON document from a binary stream of known length."""
+
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    # Characters that could continue a number cut off at the end of the buffer
+    _number_tail = re.compile(r'[-+.eE0-9]*')
+
+    def __init__(self, stream, length, chunk_size=READ_CHUNK_SIZE, timed=False):
+        self.stream = stream
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        # Characters already dropped from the front of the buffer
+        self.consumed = 0
+        # Absolute position before which _decode_objects last failed
+        self._objects_retry_at = 0
+        # Seconds spent waiting on the stream, tracked when timed
+        self.timed = timed
+        self.read_seconds = 0.0
+
+    def _fill(self, size=0):
+        """Append at least size bytes (one chunk by default) to the buffer.
+
+        Returns False at the end of the body.
+        """
+        if self.remaining <= 0:
+            return False
+        size = min(max(self.chunk_size, size), self.remaining)
+        if self.timed:
+            start = time.perf_counter()
+            data = self.stream.read(size)
+            self.read_seconds += time.perf_counter() - start
+        else:
+            data = self.stream.read(size)
+        if not data:
+            raise ValueError('Request body ended early')
+        self.remaining -= len(data)
+        self.consumed += self.pos
+        self.buffer = self.buffer[self.pos:] + self._utf8.decode(data, final=self.remaining <= 0)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _error(self, message, pos=None):
+        pos = self.pos if pos is None else pos
+        return ValueError(f'{message} at char {self.consumed + pos} of the request body')
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise self._error(f'Expecting {char!r}')
+        self.pos += 1
+
+    def decode_value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Read at least as much again as is buffered before rescanning,
+                # so a long value costs linear rather than quadratic time
+                if self._fill(len(self.buffer) - self.pos):
+                    continue
+                raise self._error(e.msg, e.pos)
+            # A number at the end of the buffer may continue in the next
+            # chunk, even where it stopped at a partial fraction or exponent
+            if self._number_tail.match(self.buffer, end).end() == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _decode_objects(self):
+        """Decode every complete object already buffered at an array element, or return None.
+
+        One raw_decode over '[' + elements + ']' is much faster than one per
+        element and shares the decoder's key memo, so the links of a batch
+        share their 'text' and 'url' key strings. The slice is cut after a '}'
+        near the end of the buffer. If that '}' does not end an element, the
+        text does not parse and an earlier '}' is tried; after a few misses
+        elements are decoded one at a time up to the cut.
+        """
+        if self.peek() != '{' or self.consumed + self.pos < self._objects_retry_at:
+            return None
+        end = len(self.buffer)
+        first_end = None
+        for _ in range(3):
+            end = self.buffer.rfind('}', self.pos, end) + 1
+            if not end:
+                return None
+            first_end = first_end or end
+            text = '[' + self.buffer[self.pos:end] + ']'
+            try:
+                values, parsed = self._decoder.raw_decode(text)
+            except json.JSONDecodeError as e:
+                # Retry before the point of failure, in buffer coordinates
+                end = self.pos + e.pos - 1
+                continue
+            if parsed == len(text):
+                # Cut at the end of an element
+                self.pos = end
+            else:
+                # The array itself ended inside the slice; stop at its ']'
+                self.pos += parsed - 2
+            return values
+        self._objects_retry_at = self.consumed + first_end
+        return None
+
+    def iter_keys(self):
+        """Yield the keys of the top-level object; the caller consumes each value."""
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                if self.peek() != '"':
+                    raise self._error('Expecting property name')
+                key = self.decode_value()
+                self._expect(':')
+                yield key
+                separator = self.peek()
+                self.pos += 1
+                if separator == '}':
+                    break
+                if separator != ',':
+                    raise self._error("Expecting ',' or '}'", self.pos - 1)
+        if self.peek():
+            raise self._error('Extra data')
+
+    def iter_array(self):
+        """Yield the elements of an array one at a time."""
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        self._objects_retry_at = 0
+        while True:
+            values = self._decode_objects()
+            if values is None:
+                yield self.decode_value()
+            else:
+                yield from values
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise self._error("Expecting ',' or ']'", self.pos - 1)
+
+
+def read_flag(query, name):
+    """Read a boolean query parameter: ?name, ?name=1 or ?name=true turn it on."""
+    value = query.get(name, ['0'])[-1].lower()
+    if value in ('', '1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'Invalid value for {name}: {value!r}')
+
+def validate_link(link, idx):
+    """Raise ValueError if the link at position idx is missing its text or URL."""
+    if not link.get('text') or not link.get('text').strip():
+        raise ValueError(f'Link {idx + 1} is missing text')
+    if not link.get('url') or not link.get('url').strip():
+        raise ValueError(f'Link {idx + 1} is missing URL')
+
+def read_page_options(data):
+    """Extract and validate the page options of a parsed request."""
+    heading = data.get('heading', 'Quick Links')
+    links = data.get('links', [])
+    open_in_new_tab = data.get('openInNewTab', True)
+    theme = data.get('theme', 'default')
+    minify = data.get('minify', False)
+    
+    if not heading or not heading.strip():
+        raise ValueError('Heading is required')
+    
+    # "false" is truthy, so only real booleans are accepted
+    if not isinstance(open_in_new_tab, bool):
+        raise ValueError('openInNewTab must be true or false')
+    if not isinstance(minify, bool):
+        raise ValueError('minify must be true or false')
+    
+    if not links or len(links) == 0:
+        raise ValueError('At least one link is required')
+    
+    return heading, links, open_in_new_tab, theme, minify
+
+def read_page_request(reader, max_links=MAX_LINKS, timer=None, digests=None):
+    """Parse a page request, validating each link as soon as it is decoded.
+
+    If digests is a dict, digests['links'] is set to the hash_links() digest
+    of the links, computed while they are parsed.
+    """
+    data = {}
+    link_error = None
+    for key in reader.iter_keys():
+        if key == 'links' and reader.peek() == '[':
+            links = []
+            hasher = hashlib.sha256()
+            for link in reader.iter_array():
+                if len(links) >= max_links:
+                    raise PayloadTooLarge(f'Too many links (maximum is {max_links})')
+                if link_error is None:
+                    start = time.perf_counter() if timer is not None else 0.0
+                    try:
+                        validate_link(link, len(links))
+                    except ValueError as e:
+                        link_error = e
+                    if timer is not None:
+                        timer.add('validate', time.perf_counter() - start)
+                links.append(link)
+                if len(links) % LINK_HASH_BATCH == 0:
+                    hash_link_batch(links[-LINK_HASH_BATCH:], hasher)
+            if len(links) % LINK_HASH_BATCH:
+                hash_link_batch(links[-(len(links) % LINK_HASH_BATCH):], hasher)
+            if digests is not None:
+                digests['links'] = hasher.hexdigest()
+            data[key] = links
+        else:
+            data[key] = reader.decode_value()
+    if not isinstance(data.get('links', []), list):
+        raise ValueError('Links must be a list')
+    if link_error is not None:
+        # The heading may come after the links in the body, but its error
+        # still takes precedence over a bad link
+        read_page_options(data)
+        raise link_error
+    return data
+
+
+# --- MINIFICATION AND COMPRESSION ---
+# Both happen once per template segment at import: minified templates drop
+# indentation and line breaks, and every static segment is deflated ahead of
+# time so a gzip response only compresses the per-request parts.
+
+_STYLE_BLOCK = re.compile(r'(<style>)(.*?)(</style>)', re.S)
+_CSS_PUNCTUATION_WS = re.compile(r'\s*([{};:,>])\s*')
+_LINE_BREAK_WS = re.compile(r'\s*\n\s*')
+
+# Deflated copies of static template segments, keyed by id(segment)
+_precompressed_segments = {}
+
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# An empty final deflate block, closing a stream of sync-flushed blocks
+_DEFLATE_FINAL_BLOCK = b'\x03\x00'
+
+def minify_html(source):
+    """Strip template whitespace: line breaks, indentation and spacing in CSS."""
+    source = _STYLE_BLOCK.sub(
+        lambda m: m.group(1) + _CSS_PUNCTUATION_WS.sub(r'\1', m.group(2).strip()) + m.group(3),
+        source
+    )
+
+    def join_lines(m):
+        # Keep one space only where a line break separates two words
+        before = source[m.start() - 1] if m.start() else ''
+        after = source[m.end()] if m.end() < len(source) else ''
+        return ' ' if before.isalnum() and after.isalnum() else ''
+
+    return _LINE_BREAK_WS.sub(join_lines, source)
+
+def precompress_segment(segment):
+    """Deflate a static segment into byte-aligned blocks that can be spliced into any stream."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    _precompressed_segments[id(segment)] = (segment, compressor.compress(segment) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported Content-Encoding for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    # The highest q-value wins; br is preferred when they tie
+    best = None
+    best_quality = 0.0
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    # An explicitly preferred identity means no compression
+    if accepted.get('identity', 0.0) > best_quality:
+        return None
+    return best
+
+def encode_stream(chunks, encoding):
+    """Apply a Content-Encoding to a stream of page chunks."""
+    if encoding == 'gzip':
+        return iter_gzip(chunks)
+    if encoding == 'br':
+        return iter_brotli(chunks)
+    return chunks
+
+def iter_gzip(chunks, level=GZIP_LEVEL):
+    """Gzip a page stream, splicing in the precompressed static template segments."""
+    yield GZIP_HEADER
+    crc = 0
+    size = 0
+    compressor = None
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        static = _precompressed_segments.get(id(chunk))
+        if static is not None and static[0] is chunk:
+            # Back-references can't cross the spliced block, so each run of
+            # dynamic chunks gets its own compressor
+            if compressor is not None:
+                yield compressor.flush(zlib.Z_SYNC_FLUSH)
+                compressor = None
+            yield static[1]
+        else:
+            if compressor is None:
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            yield compressor.compress(chunk)
+    if compressor is not None:
+        yield compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield _DEFLATE_FINAL_BLOCK + crc.to_bytes(4, 'little') + (size & 0xffffffff).to_bytes(4, 'little')
+
+def iter_brotli(chunks, quality=BROTLI_QUALITY):
+    """Brotli-compress a page stream."""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        yield compressor.process(chunk)
+    yield compressor.finish()
+
+
+# --- THEME REGISTRY ---
+# Each theme is a pack directory under THEMES_DIR:
+#
+#   theme.json         metadata: linkSelector, alertMessage
+#   page.html          page template with {safe_heading}, {range_opener_html},
+#                      {buttons_html} and {script_html} slots ({{ }} escapes braces)
+#   link.html          one link: {url}, {text}, {number} and {target_attr}
+#   range_opener.html  the range opener shown for 2+ links: {num_links}
+#
+# A pack is loaded and compiled the first time it is requested, and reloaded
+# when its files change on disk. A pack with missing files, bad JSON or
+# unknown fields is rejected at load, so requests keep its last good version
+# or fall back to the default theme. A single trailing newline of each HTML
+# file is dropped so the files can end in one.
+
+class CompiledTemplate:
+    """A theme template split into static byte segments and named slots."""
+
+    def __init__(self, source, minify=False):
+        self.segments = []
+        self.slots = []
+        pending = ''
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            # parse() yields a break at every {{ }} escape, so literals are
+            # accumulated until the next real slot
+            pending += literal
+            if field is not None:
+                if spec or conversion:
+                    raise ValueError(f'Format specs are not supported in slot {{{field}}}')
+                self.segments.append(pending)
+                self.slots.append(field)
+                pending = ''
+        self.segments.append(pending)
+        if minify:
+            self.segments = [minify_html(segment) for segment in self.segments]
+        self.segments = [segment.encode('utf-8') for segment in self.segments]
+        for segment in self.segments:
+            precompress_segment(segment)
+        self._tail = list(zip(self.slots, self.segments[1:]))
+
+    def stream(self, **values):
+        """Yield the static segments and slot values as encoded chunks.
+
+        A slot value is either a str or an iterable of already encoded chunks.
+        """
+        yield self.segments[0]
+        for name, segment in self._tail:
+            value = values[name]
+            if isinstance(value, str):
+                yield value.encode('utf-8')
+            else:
+                yield from value
+            yield segment
+
+    def discard(self):
+        """Forget the precompressed segments once the template is replaced."""
+        for segment in self.segments:
+            _precompressed_segments.pop(id(segment), None)
+
+
+class LinkFragment:
+    """A link-item fragment rendered a batch at a time by zipping columns of values."""
+
+    FIELDS = ('url', 'text', 'number', 'target_attr')
+
+    def __init__(self, source):
+        # Alternating literal text and field names, starting and ending with
+        # literals, for the fragment as written and minified
+        minified = minify_html(source).strip()
+        self._parts = {False: self._parse(source), True: self._parse(minified)}
+        # Minified links are only separated where two words would run together
+        self._separators = {False: '\n', True: ' ' if minified[-1:].isalnum() and minified[:1].isalnum() else ''}
+        self._layouts = {}
+
+    def _parse(self, source):
+        parts = ['']
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            parts[-1] += literal
+            if field is None:
+                continue
+            if field not in self.FIELDS or spec or conversion:
+                raise ValueError(f'Unknown field {{{field}}} in link fragment')
+            parts += [field, '']
+        return parts
+
+    def separator(self, minify=False):
+        """The text between two rendered links."""
+        return self._separators[minify]
+
+    def _layout(self, target_attr, minify):
+        """Literals and per-link fields with target_attr, constant per page, filled in."""
+        layout = self._layouts.get((target_attr, minify))
+        if layout is None:
+            parts = ['']
+            for index, part in enumerate(self._parts[minify]):
+                if index % 2 == 0:
+                    parts[-1] += part
+                elif part == 'target_attr':
+                    parts[-1] += target_attr
+                else:
+                    parts += [part, '']
+            layout = self._layouts[(target_attr, minify)] = parts
+        return layout
+
+    def render(self, urls, texts, start, target_attr, minify=False):
+        """Render already escaped links, numbered from start + 1, joined by separator()."""
+        layout = self._layout(target_attr, minify)
+        separator = self._separators[minify]
+        if len(layout) == 1:
+            return separator.join(repeat(layout[0], len(urls)))
+        columns = {'url': urls, 'text': texts}
+        if 'number' in layout:
+            columns['number'] = [str(number) for number in range(start + 1, start + 1 + len(urls))]
+        # Interleave constant literals with the value columns so every link is
+        # assembled by one ''.join without a per-link Python frame
+        iterables = [
+            columns[part] if index % 2 else repeat(part)
+            for index, part in enumerate(layout)
+            if index % 2 or part
+        ]
+        return separator.join(map(''.join, zip(*iterables)))
+
+
+# Stands in for the link count while a theme's script is built
+_NUM_LINKS_MARKER = '\0num_links\0'
+
+class Theme:
+    """A theme pack loaded from its directory."""
+
+    FILES = ('theme.json', 'page.html', 'link.html', 'range_opener.html')
+    PAGE_SLOTS = ('safe_heading', 'range_opener_html', 'buttons_html', 'script_html')
+
+    def __init__(self, name, path):
+        """Load and check a pack; raises OSError or ValueError if it is unusable."""
+        self.name = name
+        self.path = path
+        self.version = self.stat()
+        self._hash = hashlib.sha256()
+        metadata = json.loads(self._read('theme.json'))
+        if not isinstance(metadata, dict):
+            raise ValueError('theme.json must hold an object')
+        self.link_selector = metadata.get('linkSelector', '.link-btn')
+        self.alert_message = metadata.get('alertMessage', 'Invalid range. Please enter numbers between 1 and ${MAX_LINKS}.')
+        self.source = self._read('page.html')
+        self.link = LinkFragment(self._read('link.html'))
+        range_opener = self._read('range_opener.html')
+        self._range_openers = {False: range_opener, True: minify_html(range_opener).strip()}
+        self._scripts = {}
+        # Content hash of the pack, stable across checkouts unlike the mtimes
+        self.digest = self._hash.hexdigest()
+        template = CompiledTemplate(self.source)
+        if set(template.slots) != set(self.PAGE_SLOTS):
+            template.discard()
+            raise ValueError(f'page.html must use exactly the slots {", ".join(self.PAGE_SLOTS)}')
+        try:
+            self.render_range_opener(2)
+        except (KeyError, IndexError) as e:
+            template.discard()
+            raise ValueError(f'range_opener.html has an unknown field: {e}') from None
+        self._templates = {False: template}
+        self._stylesheets = {}
+
+    def _read(self, filename):
+        with open(os.path.join(self.path, filename), encoding='utf-8') as f:
+            content = f.read()
+        self._hash.update(f'{filename}\0{content}\0'.encode('utf-8'))
+        return content[:-1] if content.endswith('\n') else content
+
+    def stat(self):
+        """Modification times of the pack's files, used to spot changes."""
+        return tuple(os.stat(os.path.join(self.path, filename)).st_mtime_ns for filename in self.FILES)
+
+    def template(self, minify=False):
+        """Return the compiled page template, compiling the minified one on first use."""
+        template = self._templates.get(minify)
+        if template is None:
+            template = self._templates[minify] = CompiledTemplate(self.source, minify=minify)
+        return template
+
+    def stylesheet(self, minify=False):
+        """Split the inline CSS out of the page template for static builds.
+
+        Returns (template, filename, css) where the template links to the CSS
+        file instead of inlining it, or None if the page has no <style> block.
+        """
+        if minify not in self._stylesheets:
+            match = _STYLE_BLOCK.search(self.source)
+            if match is None:
+                self._stylesheets[minify] = None
+            else:
+                css = match.group(2).replace('{{', '{').replace('}}', '}')
+                if minify:
+                    css = minify_html(f'<style>{css}</style>')[len('<style>'):-len('</style>')]
+                css = css.encode('utf-8')
+                filename = f'{self.name}-{hashlib.sha256(css).hexdigest()[:12]}.css'
+                source = self.source[:match.start()] + f'<link rel="stylesheet" href="{filename}">' + self.source[match.end():]
+                self._stylesheets[minify] = (CompiledTemplate(source, minify=minify), filename, css)
+        return self._stylesheets[minify]
+
+    def render_links(self, links, start, target_attr, minify=False):
+        """Render a batch of links starting at index start."""
+        # Escape every URL and text of the batch at once instead of per field
+        escaped = escape_all([link['url'] for link in links] + [link['text'] for link in links])
+        return self.link.render(escaped[:len(links)], escaped[len(links):], start, target_attr, minify)
+
+    def render_range_opener(self, num_links, minify=False):
+        return self._range_openers[minify].format(num_links=num_links)
+
+    def render_script(self, num_links, minify=False):
+        """Render the range opener script, built and minified once per theme."""
+        parts = self._scripts.get(minify)
+        if parts is None:
+            script = render_script(_NUM_LINKS_MARKER, self.link_selector, self.alert_message)
+            if minify:
+                script = minify_html(script).strip()
+            parts = self._scripts[minify] = script.split(_NUM_LINKS_MARKER)
+        return str(num_links).join(parts)
+
+    def discard(self):
+        for template in self._templates.values():
+            template.discard()
+        for stylesheet in self._stylesheets.values():
+            if stylesheet is not None:
+                stylesheet[0].discard()
+
+
+class ThemeRegistry:
+    """Theme packs in a directory, loaded on first use and reloaded when changed."""
+
+    _name_pattern = re.compile(r'[A-Za-z0-9_-]+')
+
+    def __init__(self, root, reload_interval=THEME_RELOAD_INTERVAL, default=DEFAULT_THEME):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.default = default
+        # name -> [theme, monotonic time of the last check on disk]
+        self._themes = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Return the theme pack called name, falling back to the default theme."""
+        theme = None
+        if isinstance(name, str) and self._name_pattern.fullmatch(name):
+            theme = self._lookup(name)
+        if theme is None:
+            theme = self._lookup(self.default)
+            if theme is None:
+                raise LookupError(f'Default theme {self.default!r} not found in {self.root}')
+        return theme
+
+    def _lookup(self, name):
+        entry = self._themes.get(name)
+        now = time.monotonic()
+        if entry is not None and (self.reload_interval < 0 or now - entry[1] < self.reload_interval):
+            return entry[0]
+        with self._lock:
+            entry = self._themes.get(name)
+            if entry is None or entry[0] is None:
+                # Not loaded yet, or the last attempt failed
+                path = os.path.join(self.root, name)
+                if not os.path.isfile(os.path.join(path, 'theme.json')):
+                    self._themes.pop(name, None)
+                    return None
+                try:
+                    theme = Theme(name, path)
+                except (OSError, ValueError) as e:
+                    # Requests fall back to the default theme until the
+                    # pack loads, retried once per reload interval
+                    print(f'Could not load theme {name!r}: {e}', file=sys.stderr)
+                    theme = None
+                self._themes[name] = [theme, now]
+                return theme
+            theme = entry[0]
+            entry[1] = now
+            try:
+                changed = theme.stat() != theme.version
+                if changed:
+                    self._themes[name][0] = Theme(name, theme.path)
+            except (OSError, ValueError) as e:
+                # A pack caught mid-edit keeps serving its last good version
+                print(f'Could not reload theme {name!r}: {e}', file=sys.stderr)
+                return theme
+            if changed:
+                theme.discard()
+            return self._themes[name][0]
+
+    def names(self):
+        """Names of the theme packs available on disk."""
+        return sorted(
+            name for name in os.listdir(self.root)
+            if self._name_pattern.fullmatch(name) and os.path.isfile(os.path.join(self.root, name, 'theme.json'))
+        )
+
+
+THEMES = ThemeRegistry(THEMES_DIR)
+
+def resolve_theme(theme):
+    """Return the name of the theme that will actually render, for cache keys and metrics."""
+    return THEMES.get(theme).name
 
 
 # --- MAIN GENERATOR FUNCTION ---
 
-def generate_html_page(heading, links, open_in_new_tab=True, theme='default'):
+# Number of links rendered into each streamed chunk
+LINK_BATCH_SIZE = 500
+
+def generate_html_page(heading, links, open_in_new_tab=True, theme='default', minify=False):
     """Generate the HTML page with a selected theme."""
-    
-    safe_heading = html.escape(heading)
-    target_attr = ' target="_blank" rel="noopener noreferrer"' if open_in_new_tab else ''
-    num_links = len(links)
+    return generate_html_bytes(heading, links, open_in_new_tab, theme, minify).decode('utf-8')
 
-    # 1. Generate theme-specific HTML for buttons
-    buttons_html = ''
-    if theme == 'aurora':
-        # Aurora uses 'link-item' and has a number span
-        buttons_html = '\n'.join([
-            f'''            <a href="{html.escape(link["url"])}" class="link-item"{target_attr}>
-                <svg class="icon" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor"><path stroke-linecap="round" stroke-linejoin="round" d="M13.19 8.688a4.5 4.5 0 0 1 1.242 7.244l-4.5 4.5a4.5 4.5 0 0 1-6.364-6.364l1.757-1.757m13.35-.622 1.757-1.757a4.5 4.5 0 0 0-6.364-6.364l-4.5 4.5a4.5 4.5 0 0 0 1.242 7.244" /></svg>
-                <span class="text"><span class="number">{idx + 1}.</span> {html.escape(link["text"])}</span>
-            </a>'''
-            for idx, link in enumerate(links)
-        ])
-    elif theme == 'neon_grid':
-        # Neon Grid uses 'link-btn' and a data-text attribute for the glitch effect
-        buttons_html = '\n'.join([
-            f'''            <a href="{html.escape(link["url"])}" class="link-btn"{target_attr} data-text="{html.escape(link["text"])}">
-                {html.escape(link["text"])}
-            </a>'''
-            for link in links
-        ])
-    else: # Default theme
-        buttons_html = '\n'.join([
-            f'        <a href="{html.escape(link["url"])}" class="btn link-btn"{target_attr}>{html.escape(link["text"])}</a>'
-            for link in links
-        ])
-
-    # 2. Generate theme-specific HTML for the range opener
-    range_opener_html = ''
-    if num_links > 1:
-        if theme == 'aurora':
-            range_opener_html = f'''
-        <div class="range-opener">
-            <div class="controls">
-                <div class="control-group"><label for="start-link">From</label><input type="number" id="start-link" value="1" min="1"></div>
-                <div class="control-group"><label for="end-link">To</label><input type="number" id="end-link" value="{num_links}" min="1"></div>
-            </div>
-            <button class="btn-open" onclick="openRange()">🚀 Open Range</button>
-        </div>'''
-        elif theme == 'neon_grid':
-            range_opener_html = f'''
-        <div class="range-opener">
-            <div class="controls">
-                <label for="start-link">Range:</label><input type="number" id="start-link" value="1" min="1">
-                <label for="end-link">to</label><input type="number" id="end-link" value="{num_links}" min="1">
-            </div>
-            <button class="btn-open" onclick="openRange()">Execute</button>
-        </div>'''
-        else: # Default theme
-            range_opener_html = f'''
-        <div class="range-opener">
-            <label>Open Range:</label>
-            <div><label for="start-link">From</label><input type="number" id="start-link" value="1" min="1"></div>
-            <div><label for="end-link">To</label><input type="number" id="end-link" value="{num_links}" min="1"></div>
-            <button class="btn-open" onclick="openRange()">🚀 Open</button>
-        </div>'''
-
-    # 3. Generate script (adapts to the correct link class)
-    script_html = ''
-    if num_links > 1:
-        link_class_selector = ".link-item" if theme == 'aurora' else ".link-btn"
-        alert_message = f"> ACCESS DENIED: Invalid range. Please enter numbers between 1 and ${{MAX_LINKS}}." if theme == 'neon_grid' else f"Invalid range. Please enter numbers between 1 and ${{MAX_LINKS}}."
-        
-        script_html = f'''
+def generate_html_bytes(heading, links, open_in_new_tab=True, theme='default', minify=False):
+    """Generate the UTF-8 encoded HTML page with a selected theme."""
+    return b''.join(iter_html_page(heading, links, open_in_new_tab, theme, minify=minify))
+
+def escape_all(values):
+    """html.escape a list of strings in one pass over their concatenation."""
+    joined = '\0'.join(values)
+    if joined.count('\0') != len(values) - 1:
+        # A value contains the separator itself; escape one by one
+        return [html.escape(value) for value in values]
+    return html.escape(joined).split('\0')
+
+def render_script(num_links, link_selector, alert_message):
+    """Generate the range opener script (adapts to the theme's link class)."""
+    return f'''
     <script>
         const MAX_LINKS = {num_links}; 
         function openRange() {{
@@ -289,7 +977,7 @@ def generate_html_page(heading, links, open_in_new_tab=True, theme='default'):
                 alert(`{alert_message}`);
                 return;
             }}
-            const links = document.querySelectorAll('{link_class_selector}');
+            const links = document.querySelectorAll('{link_selector}');
             for (let i = start - 1; i < end; i++) {{
                 if (links[i] && links[i].href) {{ window.open(links[i].href, '_blank'); }}
             }}
@@ -302,19 +990,839 @@ def generate_html_page(heading, links, open_in_new_tab=True, theme='default'):
         }});
     </script>'''
 
-    # 4. Select the main HTML template based on the theme
-    templates = {
-        'default': get_default_theme_template(),
-        'aurora': get_aurora_theme_template(),
-        'neon_grid': get_neon_grid_theme_template()
-    }
-    # Fallback to default theme if an unknown theme is passed
-    html_template = templates.get(theme, templates['default'])
+def iter_html_page(heading, links, open_in_new_tab=True, theme='default', batch_size=LINK_BATCH_SIZE, minify=False,
+                   external_css=False):
+    """Yield the UTF-8 encoded HTML page in chunks, rendering links in batches.
+
+    With external_css the theme's CSS is linked from its stylesheet file (see
+    Theme.stylesheet) instead of inlined.
+    """
+    
+    # Unknown themes fall back to default
+    pack = THEMES.get(theme)
+    safe_heading = html.escape(heading)
+    target_attr = ' target="_blank" rel="noopener noreferrer"' if open_in_new_tab else ''
+    num_links = len(links)
+
+    # 1. Generate theme-specific HTML for buttons, one batch per chunk
+    def buttons_html():
+        separator = pack.link.separator(minify)
+        for start in range(0, num_links, batch_size):
+            batch_html = pack.render_links(links[start:start + batch_size], start, target_attr, minify)
+            if start:
+                batch_html = separator + batch_html
+            yield batch_html.encode('utf-8')
+
+    # 2. Generate the range opener and its script
+    range_opener_html = ''
+    script_html = ''
+    if num_links > 1:
+        range_opener_html = pack.render_range_opener(num_links, minify)
+        script_html = pack.render_script(num_links, minify)
 
-    # 5. Populate the template and return
-    return html_template.format(
+    # 3. Stream the populated template
+    html_template = pack.template(minify)
+    if external_css and pack.stylesheet(minify) is not None:
+        html_template = pack.stylesheet(minify)[0]
+    yield from html_template.stream(
         safe_heading=safe_heading,
         range_opener_html=range_opener_html,
-        buttons_html=buttons_html,
+        buttons_html=buttons_html(),
         script_html=script_html
-    )
\ No newline at end of file
+    )
+
+
+# --- RENDER CACHE ---
+# Users often regenerate the exact same page; rendered pages are kept in a
+# byte-bounded LRU keyed by a hash of the normalized request.
+
+class RenderCache:
+    """Thread-safe LRU of rendered pages bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8 if max_entry_bytes is None else max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached page for key, or None."""
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        """Store a page, evicting the least recently used ones to make room."""
+        if len(page) > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = page
+            self.size += len(page)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def fill(self, key, chunks):
+        """Pass chunks through, caching the whole page if it fits in one entry."""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size <= self.max_entry_bytes:
+                    parts.append(chunk)
+                else:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            self.put(key, b''.join(parts))
+
+    def stats(self):
+        """Return the counters reported by the health check."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+RENDER_CACHE = RenderCache(RENDER_CACHE_BYTES)
+
+# Links are hashed this many at a time, so the digest can be computed while
+# a request is parsed (see read_page_request)
+LINK_HASH_BATCH = 1024
+
+def hash_link_batch(links, hasher):
+    """Add the text and URL of a batch of links to a hash."""
+    values = [link.get('text') for link in links] + [link.get('url') for link in links]
+    try:
+        joined = '\0'.join(values)
+    except TypeError:
+        joined = None
+    if joined is None or joined.count('\0') != len(values) - 1:
+        # Values that are not strings or contain the separator are hashed as
+        # JSON instead, marked so the two forms cannot collide
+        hasher.update(b'j' + json.dumps(values, ensure_ascii=False).encode('utf-8'))
+    else:
+        hasher.update(f'{len(links)}\0{joined}\0'.encode('utf-8'))
+
+def hash_links(links):
+    """Hex digest of the text and URL of every link, LINK_HASH_BATCH at a time."""
+    hasher = hashlib.sha256()
+    for start in range(0, len(links), LINK_HASH_BATCH):
+        hash_link_batch(links[start:start + LINK_HASH_BATCH], hasher)
+    return hasher.hexdigest()
+
+def render_cache_key(heading, links, open_in_new_tab=True, theme='default', minify=False, links_digest=None):
+    """Hash the parts of a request that affect the rendered page.
+
+    links_digest is hash_links(links), if already known.
+    """
+    # The pack's content hash makes edited themes miss the cache
+    pack = THEMES.get(theme)
+    canonical = json.dumps(
+        [
+            heading,
+            links_digest or hash_links(links),
+            bool(open_in_new_tab),
+            [pack.name, pack.digest],
+            bool(minify)
+        ],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def etag_matches(etag, if_none_match):
+    """Check an If-None-Match header value against a strong ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+# --- BATCH GENERATION ---
+# POST ?batch=1 takes a JSON array of page specs, or newline-delimited JSON
+# objects, and streams back a ZIP archive with one entry per page. Pages are
+# rendered in a process pool and added to the archive as they finish; pages
+# that fail are listed in errors.json instead of failing the whole batch.
+
+ZIP_COMPRESSION = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'stored': zipfile.ZIP_STORED,
+}
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Return the shared process pool, or None to render in the calling thread."""
+    global _batch_executor
+    if BATCH_WORKERS <= 1:
+        return None
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            try:
+                _batch_executor = ProcessPoolExecutor(BATCH_WORKERS)
+            except (OSError, NotImplementedError):
+                # Some serverless hosts cannot create process pools
+                return None
+        return _batch_executor
+
+def replace_batch_executor(broken):
+    """Drop a broken shared pool and return a fresh one (or None) in its place."""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is broken:
+            _batch_executor = None
+    broken.shutdown(wait=False)
+    return get_batch_executor()
+
+def iter_page_specs(reader, max_pages=MAX_BATCH_PAGES):
+    """Yield page specs from a JSON array or from newline-delimited JSON objects."""
+    if reader.peek() == '[':
+        specs = reader.iter_array()
+    else:
+        specs = iter_json_lines(reader)
+    for index, spec in enumerate(specs):
+        if index >= max_pages:
+            raise PayloadTooLarge(f'Too many pages (maximum is {max_pages})')
+        yield spec
+    if reader.peek():
+        raise reader._error('Extra data')
+
+def iter_json_lines(reader):
+    """Yield whitespace-separated JSON values until the end of the body."""
+    while reader.peek():
+        yield reader.decode_value()
+
+def read_page_spec(spec, max_links=MAX_LINKS):
+    """Validate a batch or manifest page spec and return its page options."""
+    if not isinstance(spec, dict):
+        raise ValueError('Page spec must be an object')
+    heading, links, open_in_new_tab, theme, minify = read_page_options(spec)
+    if len(links) > max_links:
+        raise PayloadTooLarge(f'Too many links (maximum is {max_links})')
+    for idx, link in enumerate(links):
+        validate_link(link, idx)
+    return heading, links, open_in_new_tab, theme, minify
+
+def render_batch_page(spec, max_links=MAX_LINKS):
+    """Validate and render one page spec of a batch; runs in a worker process."""
+    return generate_html_bytes(*read_page_spec(spec, max_links))
+
+def iter_batch_pages(specs, executor=None, window=1, render=render_batch_page, replace_executor=None):
+    """Render page specs, yielding (index, spec, page, error) as each one finishes.
+
+    A spec that cannot be read from the body is reported with index None and
+    ends the batch after the pages already submitted. A worker process dying
+    breaks the whole pool: the pages in flight are reported as failed and the
+    rest go to the pool replace_executor returns for the broken one.
+    """
+    specs = enumerate(specs)
+    pending = {}
+    exhausted = False
+    while True:
+        # Keep a bounded number of pages in flight so specs are read lazily
+        while not exhausted and (executor is None or len(pending) < window):
+            try:
+                index, spec = next(specs)
+            except StopIteration:
+                exhausted = True
+                continue
+            except Exception as e:
+                exhausted = True
+                yield None, None, None, e
+                continue
+            while executor is not None:
+                try:
+                    pending[executor.submit(render, spec)] = (index, spec, executor)
+                    break
+                except BrokenProcessPool as e:
+                    if replace_executor is None:
+                        yield index, spec, None, e
+                        break
+                    executor = replace_executor(executor)
+            else:
+                try:
+                    yield index, spec, render(spec), None
+                except Exception as e:
+                    yield index, spec, None, e
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, spec, submitted_to = pending.pop(future)
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool) and submitted_to is executor and replace_executor is not None:
+                executor = replace_executor(executor)
+            yield index, spec, None if error else future.result(), error
+
+def batch_filename(spec, index):
+    """Pick the archive name for a page: its 'filename' or page-<n>.html."""
+    name = spec.get('filename') if isinstance(spec, dict) else None
+    name = os.path.basename(str(name)) if name else ''
+    if not name:
+        name = f'page-{index + 1}.html'
+    if not name.endswith('.html'):
+        name += '.html'
+    return name
+
+def unique_filename(name, used, index):
+    """Suffix a page's filename with its number if an earlier page took it."""
+    if name in used:
+        name = f'{name[:-len(".html")]}-{index + 1}.html'
+    used.add(name)
+    return name
+
+def write_batch(archive, specs, max_links=MAX_LINKS):
+    """Render page specs into an open ZipFile and append errors.json."""
+    executor = get_batch_executor()
+    window = BATCH_WORKERS * 4
+    names = set()
+    errors = []
+    render = partial(render_batch_page, max_links=max_links)
+    for index, spec, page, error in iter_batch_pages(specs, executor, window, render, replace_batch_executor):
+        if error is not None:
+            errors.append({
+                'page': None if index is None else index + 1,
+                'filename': None if index is None else batch_filename(spec, index),
+                'error': str(error)
+            })
+            continue
+        archive.writestr(unique_filename(batch_filename(spec, index), names, index), page)
+    archive.writestr('errors.json', json.dumps(errors, indent=2))
+    return errors
+
+
+# --- INSTRUMENTATION ---
+# With HTML_GENERATOR_METRICS on, every generated page records how long it
+# spent reading the body, parsing it, validating links, hashing it for the
+# cache, rendering and writing to the socket. Timings are aggregated into
+# histograms per theme and link-count bucket and served on GET /metrics.
+
+class PhaseTimer:
+    """Per-phase durations of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.mark = self.started
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def lap(self, phase, minus=0.0):
+        """Charge the time since the previous lap, less minus, to phase."""
+        now = time.perf_counter()
+        self.add(phase, now - self.mark - minus)
+        self.mark = now
+
+    def time_iter(self, phase, iterable):
+        """Yield from iterable, charging the time spent producing items to phase."""
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.lap(phase)
+                return
+            self.lap(phase)
+            yield item
+
+    def total(self):
+        return self.mark - self.started
+
+    def server_timing(self):
+        """Format the phases so far as a Server-Timing header value."""
+        return ', '.join(f'{phase};dur={seconds * 1000:.3f}' for phase, seconds in self.phases.items())
+
+
+class PhaseMetrics:
+    """Thread-safe histograms of request phase durations by theme and link count."""
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    LINK_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (phase, theme, links) -> per-bucket counts, +Inf count, sum
+        self._series = {}
+
+    def observe(self, timer, theme, num_links):
+        links = next((str(bound) for bound in self.LINK_BUCKETS if num_links <= bound), '+Inf')
+        phases = dict(timer.phases, total=timer.total())
+        with self._lock:
+            for phase, seconds in phases.items():
+                series = self._series.get((phase, theme, links))
+                if series is None:
+                    series = self._series[(phase, theme, links)] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+                series[bisect_left(self.BUCKETS, seconds)] += 1
+                series[-1] += seconds
+
+    def exposition(self):
+        """Render the histograms and cache counters in Prometheus text format."""
+        lines = [
+            '# HELP html_generator_phase_seconds Time spent in each phase of page generation.',
+            '# TYPE html_generator_phase_seconds histogram',
+        ]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for (phase, theme, links), values in series:
+            labels = f'phase="{phase}",theme="{theme}",links="{links}"'
+            count = 0
+            for bound, bucket_count in zip(self.BUCKETS, values):
+                count += bucket_count
+                lines.append(f'html_generator_phase_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            count += values[len(self.BUCKETS)]
+            lines.append(f'html_generator_phase_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'html_generator_phase_seconds_sum{{{labels}}} {values[-1]:.6f}')
+            lines.append(f'html_generator_phase_seconds_count{{{labels}}} {count}')
+
+        cache = RENDER_CACHE.stats()
+        for name, kind, value in (
+            ('hits_total', 'counter', cache['hits']),
+            ('misses_total', 'counter', cache['misses']),
+            ('evictions_total', 'counter', cache['evictions']),
+            ('entries', 'gauge', cache['entries']),
+            ('bytes', 'gauge', cache['bytes']),
+        ):
+            lines.append(f'# TYPE html_generator_render_cache_{name} {kind}')
+            lines.append(f'html_generator_render_cache_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = PhaseMetrics()
+
+
+# --- STATIC SITE BUILD ---
+# Offline builds render a manifest of page specs (newline-delimited JSON, or
+# a JSON array, as accepted by batch requests) straight to a directory:
+#
+#     python -m api.generate build pages.jsonl --output site/
+#
+# Builds are incremental: BUILD_INDEX in the output directory maps each page
+# to the hash of its request and theme pack and to the stylesheet it links,
+# and pages whose hash is unchanged are skipped. Theme CSS goes to one shared
+# stylesheet per theme instead of being inlined in every page. Pages and
+# stylesheets a complete build no longer produces are removed.
+
+BUILD_INDEX = '.build-index.json'
+
+def write_file_atomic(path, chunks):
+    """Write chunks to path through a temporary file so readers never see a partial file."""
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temp_path, path)
+
+def build_page(job):
+    """Render one manifest page to disk unless unchanged; runs in a worker process.
+
+    job is (spec, path, previous_key, external_css); returns (key, stylesheet,
+    written) where stylesheet is the name of the CSS file the page links, if any.
+    """
+    spec, path, previous_key, external_css = job
+    heading, links, open_in_new_tab, theme, minify = read_page_spec(spec)
+    key = render_cache_key(heading, links, open_in_new_tab, theme, minify)
+    if external_css:
+        key += '-external-css'
+    # The stylesheet is restored even for unchanged pages, which link it
+    stylesheet = THEMES.get(theme).stylesheet(minify) if external_css else None
+    filename = None
+    if stylesheet is not None:
+        _, filename, css = stylesheet
+        css_path = os.path.join(os.path.dirname(path), filename)
+        # Named after its content, so an existing file is already correct
+        if not os.path.exists(css_path):
+            write_file_atomic(css_path, [css])
+    if key == previous_key and os.path.exists(path):
+        return key, filename, False
+
+    write_file_atomic(path, iter_html_page(
+        heading, links, open_in_new_tab, theme, minify=minify, external_css=external_css
+    ))
+    return key, filename, True
+
+def read_build_index(path):
+    """Return the page -> [key, stylesheet] entries of a build index, or {}."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            pages = json.load(f).get('pages', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+    return {
+        name: entry for name, entry in pages.items()
+        # Only plain file names in the output directory are trusted
+        if name == os.path.basename(name) and isinstance(entry, list) and len(entry) == 2
+    }
+
+def build_site(manifest, output, workers=BATCH_WORKERS, external_css=True, force=False):
+    """Build every page of a manifest into output; returns (written, skipped, removed, errors)."""
+    os.makedirs(output, exist_ok=True)
+    index_path = os.path.join(output, BUILD_INDEX)
+    previous = read_build_index(index_path)
+
+    pages = {}
+    names = set()
+    written = 0
+    skipped = 0
+    removed = 0
+    errors = []
+    complete = False
+
+    def jobs(specs):
+        for index, spec in enumerate(specs):
+            name = unique_filename(batch_filename(spec, index), names, index)
+            previous_key = None if force else previous.get(name, [None])[0]
+            yield spec, os.path.join(output, name), previous_key, external_css
+
+    with open(manifest, 'rb') as f:
+        reader = JSONStreamReader(f, os.fstat(f.fileno()).st_size)
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+
+        def replace_executor(broken):
+            nonlocal executor
+            broken.shutdown(wait=False)
+            executor = ProcessPoolExecutor(workers)
+            return executor
+
+        try:
+            results = iter_batch_pages(
+                jobs(iter_page_specs(reader, sys.maxsize)), executor, workers * 4, build_page, replace_executor
+            )
+            for index, job, result, error in results:
+                if error is not None:
+                    errors.append({
+                        'page': None if index is None else index + 1,
+                        'filename': None if index is None else os.path.basename(job[1]),
+                        'error': str(error)
+                    })
+                    if index is not None and os.path.basename(job[1]) in previous:
+                        # Keep the last good build of a page that now fails
+                        pages[os.path.basename(job[1])] = previous[os.path.basename(job[1])]
+                    continue
+                key, stylesheet, was_written = result
+                pages[os.path.basename(job[1])] = [key, stylesheet]
+                if was_written:
+                    written += 1
+                else:
+                    skipped += 1
+            # A manifest that could not be read to the end leaves pages unknown
+            complete = not any(error['page'] is None for error in errors)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if complete:
+                # Remove what the previous build made and this one did not
+                keep = set(pages) | {entry[1] for entry in pages.values()}
+                stale = (set(previous) | {entry[1] for entry in previous.values()}) - keep
+                for name in sorted(filter(None, stale)):
+                    if name != os.path.basename(name):
+                        continue
+                    try:
+                        os.remove(os.path.join(output, name))
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            else:
+                # Entries not reached are kept so a later build can still clean them up
+                pages = dict(previous, **pages)
+            # Record what was built even if the build was interrupted
+            write_file_atomic(index_path, [json.dumps({'pages': pages}, indent=2, sort_keys=True).encode('utf-8')])
+    return written, skipped, removed, errors
+
+def build_main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m api.generate build', description='Build static pages from a manifest.')
+    parser.add_argument('manifest', help='newline-delimited JSON page specs, or a JSON array of them')
+    parser.add_argument('--output', '-o', required=True, help='directory to write the pages to')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='rendering processes (default: %(default)s)')
+    parser.add_argument('--inline-css', action='store_true', help='inline theme CSS in every page')
+    parser.add_argument('--force', action='store_true', help='rebuild pages even if unchanged')
+    args = parser.parse_args(argv)
+
+    written, skipped, removed, errors = build_site(args.manifest, args.output, args.workers, not args.inline_css, args.force)
+    for error in errors:
+        location = f'page {error["page"]} ({error["filename"]})' if error['page'] else 'manifest'
+        print(f'{location}: {error["error"]}', file=sys.stderr)
+    print(f'{written} written, {skipped} unchanged, {removed} removed, {len(errors)} failed', file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+
+# --- STANDALONE SERVER ---
+# The serverless host imports `handler` directly. For self-hosting, run
+#
+#     python -m api.generate --port 8000 --workers 16 [--processes 4]
+#
+# which serves the same handler with keep-alive connections, a bounded pool
+# of worker threads and, optionally, several pre-forked processes sharing
+# one listening socket. A connection only holds a worker while one of its
+# requests is handled; in between it waits in a selector, so idle keep-alive
+# clients cannot starve active ones.
+
+class ServerHandler(handler):
+    """handler variant for the standalone server, driven one request at a time."""
+    keep_alive = True
+    # Idle keep-alive connections are closed after this many seconds, which
+    # also bounds each read while a request is handled
+    timeout = 15
+
+    def __init__(self, request, client_address, server):
+        # Unlike BaseRequestHandler, don't handle the connection on creation;
+        # the server calls handle_one_request() whenever a request arrives
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = False
+        self.setup()
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        # Finish the current request but stop reusing connections once the
+        # server is shutting down
+        if self.server.draining:
+            self.close_connection = True
+
+    def has_buffered_request(self):
+        """Whether the next (pipelined) request can be read without waiting."""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer handing each request to a bounded pool of worker threads."""
+
+    def __init__(self, server_address, handler_class, workers, max_connections=MAX_CONNECTIONS):
+        super().__init__(server_address, handler_class)
+        self.draining = False
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='html-generator')
+        # Accepting blocks once max_connections are open, leaving further
+        # connections in the listen backlog
+        self._connections = threading.BoundedSemaphore(max_connections)
+        # Connections waiting for their next request, handed to the idle
+        # poller thread, which owns the selector
+        self._parked = deque()
+        self._poller = None
+        self._waker = None
+        self._stopped = False
+
+    def serve_forever(self, poll_interval=0.5):
+        # Started here rather than in __init__ so every pre-forked process
+        # gets its own poller thread and wake-up socket
+        self._waker = socket.socketpair()
+        self._poller = threading.Thread(target=self._poll_idle, name='html-generator-idle', daemon=True)
+        self._poller.start()
+        super().serve_forever(poll_interval)
+
+    def process_request(self, request, client_address):
+        self._connections.acquire()
+        try:
+            connection = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            self._connections.release()
+            return
+        self._park(connection)
+
+    def _park(self, connection):
+        connection.idle_since = time.monotonic()
+        self._parked.append(connection)
+        self._wake()
+
+    def _wake(self):
+        if self._waker is not None:
+            try:
+                self._waker[1].send(b'\0')
+            except OSError:
+                pass
+
+    def _poll_idle(self):
+        """Hand connections with a new request to the workers and expire idle ones."""
+        selector = selectors.DefaultSelector()
+        selector.register(self._waker[0], selectors.EVENT_READ)
+        try:
+            while not self._stopped:
+                for key, _ in selector.select(1.0):
+                    if key.data is None:
+                        self._waker[0].recv(4096)
+                        continue
+                    selector.unregister(key.fileobj)
+                    self.executor.submit(self._handle, key.data)
+                while self._parked:
+                    connection = self._parked.popleft()
+                    selector.register(connection.connection, selectors.EVENT_READ, connection)
+                now = time.monotonic()
+                for key in list(selector.get_map().values()):
+                    connection = key.data
+                    if connection is None:
+                        continue
+                    if self.draining or (connection.timeout is not None and now - connection.idle_since > connection.timeout):
+                        selector.unregister(key.fileobj)
+                        self._close(connection)
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    self._close(key.data)
+            while self._parked:
+                self._close(self._parked.popleft())
+            selector.close()
+
+    def _handle(self, connection):
+        try:
+            while True:
+                connection.handle_one_request()
+                if connection.close_connection or self.draining:
+                    self._close(connection)
+                    return
+                if not connection.has_buffered_request():
+                    break
+        except Exception:
+            self.handle_error(connection.request, connection.client_address)
+            self._close(connection)
+            return
+        self._park(connection)
+
+    def _close(self, connection):
+        try:
+            connection.finish()
+        except OSError:
+            pass
+        self.shutdown_request(connection.request)
+        self._connections.release()
+
+    def begin_shutdown(self):
+        """Stop accepting connections and close idle ones; safe to call from a signal handler."""
+        self.draining = True
+        self._wake()
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        """Close the socket, wait for in-flight requests and close every connection."""
+        self.draining = True
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self._stopped = True
+        if self._poller is None:
+            while self._parked:
+                self._close(self._parked.popleft())
+        else:
+            self._wake()
+            self._poller.join()
+            for sock in self._waker:
+                sock.close()
+
+
+def run_server(server):
+    """Serve until SIGTERM or SIGINT, then drain in-flight requests."""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: server.begin_shutdown())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def run_prefork(server, processes):
+    """Fork worker processes serving the shared socket, restarting any that die."""
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_server(server)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop_children(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(processes):
+        spawn()
+    signal.signal(signal.SIGTERM, stop_children)
+    signal.signal(signal.SIGINT, stop_children)
+    # The parent keeps its copy of the socket to fork replacements
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if not stopping:
+            print(f'Server process {pid} exited with status {status}; restarting it', file=sys.stderr)
+            # Don't spin if children die straight away
+            time.sleep(1)
+            if not stopping:
+                spawn()
+    server.socket.close()
+
+def main(argv=None):
+    import argparse
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['build']:
+        build_main(argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(prog='python -m api.generate', description='Run the HTML Generator API server.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to bind (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=16, help='worker threads per process (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=1, help='pre-forked server processes (default: %(default)s)')
+    parser.add_argument('--metrics', action='store_true', default=COLLECT_METRICS,
+                        help='collect per-phase timings and serve them on GET /metrics')
+    parser.add_argument('--server-timing', action='store_true', default=SERVER_TIMING,
+                        help='send a Server-Timing header with each generated page')
+    parser.add_argument('--keepalive-timeout', type=float, default=ServerHandler.timeout,
+                        help='seconds an idle keep-alive connection is kept open (default: %(default)s)')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help='open connections per process, idle ones included (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.processes < 1 or args.max_connections < 1:
+        parser.error('--workers, --processes and --max-connections must be at least 1')
+
+    ServerHandler.timeout = args.keepalive_timeout
+    ServerHandler.collect_metrics = args.metrics
+    ServerHandler.server_timing = args.server_timing
+    server = PooledHTTPServer((args.host, args.port), ServerHandler, args.workers, args.max_connections)
+    print(f'Serving on http://{args.host}:{server.server_address[1]} '
+          f'({args.processes} process(es) x {args.workers} worker(s))', file=sys.stderr)
+    if args.processes > 1:
+        run_prefork(server, args.processes)
+    else:
+        run_server(server)
+
+
+if __name__ == '__main__':
+    main()
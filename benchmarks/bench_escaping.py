@@ -0,0 +1,82 @@
+"""Time bulk HTML escaping of link fields against per-field escaping.
+
+tests/test_escaping.py checks that both produce the same bytes. Run from
+the repository root:
+
+    python benchmarks/bench_escaping.py [--links N]
+"""
+import argparse
+import html
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+THEMES = ['default', 'aurora', 'neon_grid']
+TARGET_ATTR = ' target="_blank" rel="noopener noreferrer"'
+
+
+def per_field_render_link_batch(links, start, theme, target_attr):
+    """The buttons as rendered before bulk escaping, one html.escape per field."""
+    if theme == 'aurora':
+        return '\n'.join([
+            f'''            <a href="{html.escape(link["url"])}" class="link-item"{target_attr}>
+                <svg class="icon" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor"><path stroke-linecap="round" stroke-linejoin="round" d="M13.19 8.688a4.5 4.5 0 0 1 1.242 7.244l-4.5 4.5a4.5 4.5 0 0 1-6.364-6.364l1.757-1.757m13.35-.622 1.757-1.757a4.5 4.5 0 0 0-6.364-6.364l-4.5 4.5a4.5 4.5 0 0 0 1.242 7.244" /></svg>
+                <span class="text"><span class="number">{idx + 1}.</span> {html.escape(link["text"])}</span>
+            </a>'''
+            for idx, link in enumerate(links, start)
+        ])
+    elif theme == 'neon_grid':
+        return '\n'.join([
+            f'''            <a href="{html.escape(link["url"])}" class="link-btn"{target_attr} data-text="{html.escape(link["text"])}">
+                {html.escape(link["text"])}
+            </a>'''
+            for link in links
+        ])
+    else:
+        return '\n'.join([
+            f'        <a href="{html.escape(link["url"])}" class="btn link-btn"{target_attr}>{html.escape(link["text"])}</a>'
+            for link in links
+        ])
+
+
+def bulk_render_link_batch(links, start, theme, target_attr):
+    return generate.THEMES.get(theme).render_links(links, start, target_attr)
+
+
+def sample_links(count):
+    texts = ['Plain link', '<b>"Tom & Jerry"</b>', "it's", 'Grüße 🚀 链接', '&amp; already', '']
+    urls = ['https://example.com/', 'https://example.com/?a=1&b=<2>', "javascript:alert('x')", 'https://例子.example/']
+    return [{'text': f'{texts[i % len(texts)]} {i}', 'url': f'{urls[i % len(urls)]}{i}'} for i in range(count)]
+
+
+def best_of(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=100000)
+    args = parser.parse_args()
+
+    links = sample_links(args.links)
+    size = generate.LINK_BATCH_SIZE
+    print(f'{"theme":<10} {"per-field ms":>13} {"bulk ms":>9} {"speedup":>8}')
+    for theme in THEMES:
+        def render(func):
+            return lambda: [func(links[i:i + size], i, theme, TARGET_ATTR) for i in range(0, len(links), size)]
+        before = best_of(render(per_field_render_link_batch))
+        after = best_of(render(bulk_render_link_batch))
+        print(f'{theme:<10} {before * 1000:>13.1f} {after * 1000:>9.1f} {before / after:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compare peak memory and latency of full-document and streamed rendering.
+
+Run from the repository root:
+
+    python benchmarks/bench_streaming.py [--theme THEME]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+LINK_COUNTS = [1000, 10000, 100000]
+
+
+def full_document(links, theme):
+    # What do_POST used to hold before writing: the whole page as one object
+    return len(generate.generate_html_bytes('Quick Links', links, True, theme))
+
+
+def streamed(links, theme):
+    return sum(len(chunk) for chunk in generate.iter_html_page('Quick Links', links, True, theme))
+
+
+def measure(func, links, theme):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(links, theme)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--theme', default='aurora', choices=generate.THEMES.names())
+    args = parser.parse_args()
+
+    print(f'{"links":>7} {"mode":<9} {"bytes":>11} {"ms":>9} {"peak KiB":>10}')
+    for count in LINK_COUNTS:
+        links = [{'text': f'Link {i}', 'url': f'https://example.com/{i}'} for i in range(count)]
+        for name, func in (('full', full_document), ('streamed', streamed)):
+            size, elapsed, peak = measure(func, links, args.theme)
+            print(f'{count:>7} {name:<9} {size:>11} {elapsed * 1000:>9.1f} {peak / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compare full page renders before and after the compiled theme registry.
+
+"before" renders pages the pre-registry way: per-link f-strings with one
+html.escape per field, then str.format on a freshly fetched page template.
+"after" is generate_html_bytes. Both produce the same bytes.
+
+Run from the repository root:
+
+    python benchmarks/bench_themes.py [--links N ...] [--seconds S]
+"""
+import argparse
+import html
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+from bench_escaping import TARGET_ATTR, per_field_render_link_batch, sample_links
+
+THEMES = ['default', 'aurora', 'neon_grid']
+
+# The pre-registry code had one function per theme returning its template as
+# a string literal; these stand in for them without going through the registry
+_SOURCES = {name: generate.THEMES.get(name).source for name in THEMES}
+
+
+def read_range_opener(theme):
+    with open(os.path.join(generate.THEMES_DIR, theme, 'range_opener.html'), encoding='utf-8') as f:
+        source = f.read()
+    return source[:-1] if source.endswith('\n') else source
+
+
+_RANGE_OPENERS = {name: read_range_opener(name) for name in THEMES}
+
+
+def get_default_theme_template():
+    return _SOURCES['default']
+
+
+def get_aurora_theme_template():
+    return _SOURCES['aurora']
+
+
+def get_neon_grid_theme_template():
+    return _SOURCES['neon_grid']
+
+
+def format_page(heading, links, theme):
+    """The pre-registry generate_html_page, encoded for the response."""
+    num_links = len(links)
+    buttons_html = per_field_render_link_batch(links, 0, theme, TARGET_ATTR)
+    range_opener_html = ''
+    script_html = ''
+    if num_links > 1:
+        range_opener_html = _RANGE_OPENERS[theme].format(num_links=num_links)
+        pack = generate.THEMES.get(theme)
+        script_html = generate.render_script(num_links, pack.link_selector, pack.alert_message)
+    templates = {
+        'default': get_default_theme_template(),
+        'aurora': get_aurora_theme_template(),
+        'neon_grid': get_neon_grid_theme_template()
+    }
+    return templates.get(theme, templates['default']).format(
+        safe_heading=html.escape(heading),
+        range_opener_html=range_opener_html,
+        buttons_html=buttons_html,
+        script_html=script_html
+    ).encode('utf-8')
+
+
+def compiled_page(heading, links, theme):
+    return generate.generate_html_bytes(heading, links, True, theme)
+
+
+def requests_per_second(func, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f'{"theme":<10} {"links":>7} {"before rps":>12} {"after rps":>12} {"speedup":>8}')
+    for count in args.links:
+        links = sample_links(count)
+        for theme in THEMES:
+            if format_page('Quick Links', links, theme) != compiled_page('Quick Links', links, theme):
+                raise SystemExit(f'Pages differ for theme {theme!r}')
+            before = requests_per_second(lambda: format_page('Quick Links', links, theme), args.seconds)
+            after = requests_per_second(lambda: compiled_page('Quick Links', links, theme), args.seconds)
+            print(f'{theme:<10} {count:>7} {before:>12.0f} {after:>12.0f} {after / before:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
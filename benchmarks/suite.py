@@ -0,0 +1,299 @@
+"""Rendering and load benchmark suite for the generator API.
+
+Every case renders synthetic pages either by calling generate_html_page
+directly ("render") or by POSTing to the handler over a local socket
+("http"). Each case runs in a fresh process so its peak RSS is its own.
+
+Run from the repository root:
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --quick --compare results.json
+
+HTTP cases can drive the server from several concurrent clients with
+--clients. Every case runs --repeat times, in rounds over all cases; the
+best timing figures and the median peak RSS are kept, since interference
+only slows a run down.
+
+With --compare the run is checked against a stored result file and the
+exit status is 1 when any case's median latency, throughput or peak
+memory regressed by more than --threshold. Timings are first corrected
+for the machine's speed, taken from a fixed calibration workload timed
+before each case. p99 latency is reported but not gated, being too noisy, and
+cases with fewer than --min-gate-runs samples are skipped.
+"""
+import argparse
+import html
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+THEMES = ['default', 'aurora', 'neon_grid']
+LINK_COUNTS = [1, 100, 1000, 10000, 100000]
+QUICK_LINK_COUNTS = [1, 100, 1000]
+MODES = ['render', 'http']
+# Figures checked by --compare, whether a higher value is worse and
+# whether they follow the machine's speed
+GATED_METRICS = (('p50_ms', 1, True), ('throughput_rps', -1, True), ('peak_rss_kib', 1, False))
+
+# Link text and URL builders for each payload flavour
+TEXT_STYLES = {
+    'ascii': (
+        lambda i: f'Link {i}',
+        lambda i: f'https://example.com/page/{i}',
+    ),
+    'unicode': (
+        lambda i: f'Ссылка {i} — 链接 🚀 Grüße',
+        lambda i: f'https://例子.example/路径/{i}?q=ünïcödé',
+    ),
+    'escaped': (
+        lambda i: f'<b>"Tom & Jerry"</b> \'{i}\' <<&&>>',
+        lambda i: f'https://example.com/?a={i}&b=<script>&c="quoted"&d=\'x\'',
+    ),
+}
+
+
+def make_payload(links, text_style, theme):
+    text, url = TEXT_STYLES[text_style]
+    return {
+        'heading': f'Benchmark <{text_style}> & "{theme}"',
+        'links': [{'text': text(i), 'url': url(i)} for i in range(links)],
+        'openInNewTab': True,
+        'theme': theme,
+    }
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(samples) - 1, round(fraction * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def time_runs(func, min_runs, max_runs, seconds):
+    """Call func at least min_runs times and until seconds have passed."""
+    latencies = []
+    size = 0
+    started = time.perf_counter()
+    while len(latencies) < max_runs:
+        start = time.perf_counter()
+        size = func()
+        latencies.append(time.perf_counter() - start)
+        if len(latencies) >= min_runs and time.perf_counter() - started >= seconds:
+            break
+    return latencies, size
+
+
+def calibrate(runs=10):
+    """Best time in ms of a fixed stdlib-only workload, tracking machine speed."""
+    text = ''.join(f'<a href="https://example.com/{i}?a=1&b=2">Link \'{i}\'</a>' for i in range(5000))
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        json.dumps([html.escape(text), text.encode('utf-8').decode('utf-8')])
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def render_case(payload, options, clients):
+    def run():
+        page = generate.generate_html_page(payload['heading'], payload['links'], payload['openInNewTab'], payload['theme'])
+        return len(page.encode('utf-8'))
+    latencies, size = time_runs(run, options['min_runs'], options['max_runs'], options['seconds'])
+    return latencies, size, sum(latencies)
+
+
+def http_case(payload, options, clients):
+    """Time POSTs from clients concurrent keep-alive connections."""
+    # Every request must render, so the render cache is disabled
+    generate.RENDER_CACHE = generate.RenderCache(0)
+    server = generate.PooledHTTPServer(('127.0.0.1', 0), generate.ServerHandler, max(4, clients))
+    server.RequestHandlerClass.log_message = lambda *args: None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    body = json.dumps(payload).encode('utf-8')
+    results = []
+    errors = []
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+
+        def run():
+            connection.request('POST', '/api/generate', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            page = response.read()
+            if response.status != 200:
+                raise RuntimeError(f'HTTP {response.status}: {page[:200]!r}')
+            return len(page)
+
+        try:
+            results.append(time_runs(run, options['min_runs'], options['max_runs'], options['seconds']))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    try:
+        start = time.perf_counter()
+        for client_thread in threads:
+            client_thread.start()
+        for client_thread in threads:
+            client_thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    if errors:
+        raise errors[0]
+    return [latency for latencies, _ in results for latency in latencies], results[0][1], elapsed
+
+
+def run_case(case, options):
+    """Run one benchmark case; called in a fresh worker process."""
+    payload = make_payload(case['links'], case['text'], case['theme'])
+    runner = render_case if case['mode'] == 'render' else http_case
+    calibration = calibrate()
+    latencies, size, total = runner(payload, options, case['clients'])
+    latencies.sort()
+    return dict(
+        case,
+        runs=len(latencies),
+        page_bytes=size,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        throughput_rps=len(latencies) / total,
+        bytes_per_sec=size * len(latencies) / total,
+        peak_rss_kib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        calibration_ms=calibration,
+    )
+
+
+def combine(repeats):
+    """Merge repeated runs of a case into its best timings and median RSS.
+
+    The worst repeat of each gated timing is kept as <metric>_worst, so a
+    comparison can tell a real slowdown from the spread between repeats.
+    """
+    result = dict(repeats[0], runs=sum(repeat['runs'] for repeat in repeats), repeats=len(repeats))
+    for metric, best in (('p50_ms', min), ('p99_ms', min), ('throughput_rps', max), ('bytes_per_sec', max),
+                         ('calibration_ms', min)):
+        result[metric] = best(repeat[metric] for repeat in repeats)
+    result['p50_ms_worst'] = max(repeat['p50_ms'] for repeat in repeats)
+    result['throughput_rps_worst'] = min(repeat['throughput_rps'] for repeat in repeats)
+    result['peak_rss_kib'] = statistics.median(repeat['peak_rss_kib'] for repeat in repeats)
+    return result
+
+
+def case_key(result):
+    return (result['mode'], result['theme'], result['text'], result['links'], result.get('clients', 1))
+
+
+def compare(results, baseline, threshold, min_runs):
+    """Return a description of every case slower than the baseline by threshold.
+
+    Timings are compared after scaling the baseline by how much slower or
+    faster the machine ran the calibration workload over the whole run, and
+    only count when the best repeat is also worse than the baseline's worst.
+    """
+    previous = {case_key(result): result for result in baseline['results']}
+    pairs = [
+        (result, previous[case_key(result)]) for result in results
+        if case_key(result) in previous and min(result['runs'], previous[case_key(result)]['runs']) >= min_runs
+    ]
+    speeds = [result['calibration_ms'] / old['calibration_ms'] for result, old in pairs if old.get('calibration_ms')]
+    speed = statistics.median(speeds) if speeds else 1.0
+    regressions = []
+    for result, old in pairs:
+        for metric, worse, timed in GATED_METRICS:
+            expected = old[metric] * speed ** worse if timed else old[metric]
+            change = (result[metric] - expected) / expected if expected else 0.0
+            spread = old.get(f'{metric}_worst', old[metric]) * speed ** worse if timed else old[metric]
+            if change * worse > threshold and (result[metric] - spread) * worse > 0:
+                regressions.append(f'{"/".join(map(str, case_key(result)))}: {metric} '
+                                   f'{old[metric]:.2f} -> {result[metric]:.2f} ({change:+.0%} at {speed:.2f}x machine time)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--themes', nargs='+', default=THEMES, choices=THEMES)
+    parser.add_argument('--links', nargs='+', type=int, help=f'link counts (default: {LINK_COUNTS})')
+    parser.add_argument('--text', nargs='+', default=sorted(TEXT_STYLES), choices=sorted(TEXT_STYLES))
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--clients', nargs='+', type=int, default=[1],
+                        help='concurrent connections for http cases (default: %(default)s)')
+    parser.add_argument('--quick', action='store_true', help=f'only run {QUICK_LINK_COUNTS} links')
+    parser.add_argument('--seconds', type=float, default=1.0, help='minimum time spent on each case')
+    parser.add_argument('--min-runs', type=int, default=3)
+    parser.add_argument('--max-runs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each case (default: %(default)s)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown (default: %(default)s)')
+    parser.add_argument('--min-gate-runs', type=int, default=20,
+                        help='samples a case needs before --compare gates it (default: %(default)s)')
+    args = parser.parse_args()
+
+    link_counts = args.links or (QUICK_LINK_COUNTS if args.quick else LINK_COUNTS)
+    options = {'seconds': args.seconds, 'min_runs': args.min_runs, 'max_runs': args.max_runs}
+    cases = [
+        {'mode': mode, 'theme': theme, 'text': text, 'links': links, 'clients': clients}
+        for mode in args.modes for theme in args.themes for text in args.text for links in link_counts
+        for clients in (args.clients if mode == 'http' else [1])
+    ]
+
+    print(f'{"mode":<7} {"theme":<10} {"text":<8} {"links":>7} {"clients":>7} {"p50 ms":>9} {"p99 ms":>9} '
+          f'{"req/s":>9} {"MB/s":>8} {"RSS MiB":>8}')
+    results = []
+    # One process per case keeps peak RSS figures independent
+    context = multiprocessing.get_context('fork')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        # Rounds go over every case so a slow spell on the machine is spread out
+        repeats = [[] for _ in cases]
+        for _ in range(args.repeat - 1):
+            for case, case_repeats in zip(cases, repeats):
+                case_repeats.append(pool.apply(run_case, (case, options)))
+        for case, case_repeats in zip(cases, repeats):
+            result = combine(case_repeats + [pool.apply(run_case, (case, options))])
+            results.append(result)
+            print(f'{result["mode"]:<7} {result["theme"]:<10} {result["text"]:<8} {result["links"]:>7} {result["clients"]:>7} '
+                  f'{result["p50_ms"]:>9.2f} {result["p99_ms"]:>9.2f} {result["throughput_rps"]:>9.1f} '
+                  f'{result["bytes_per_sec"] / 1e6:>8.1f} {result["peak_rss_kib"] / 1024:>8.1f}', flush=True)
+
+    report = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'options': options,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_gate_runs)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold:.0%} against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compressed page streams must decode to the plain page."""
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+# Gzip container, 32K window
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def sample_links(count):
+    return [{'text': f'Link <{i}> & "more"', 'url': f'https://example.com/?page={i}&q=ü'} for i in range(count)]
+
+
+@pytest.mark.parametrize('theme', generate.THEMES.names())
+@pytest.mark.parametrize('minify', [False, True])
+@pytest.mark.parametrize('open_in_new_tab', [True, False])
+@pytest.mark.parametrize('count', [1, 2 * generate.LINK_BATCH_SIZE + 3])
+def test_gzip_stream_matches_page(theme, minify, open_in_new_tab, count):
+    links = sample_links(count)
+    chunks = list(generate.iter_html_page('Heading <&>', links, open_in_new_tab, theme, minify=minify))
+    # The stream must actually splice precompressed template segments
+    assert any(id(chunk) in generate._precompressed_segments for chunk in chunks)
+    page = zlib.decompress(b''.join(generate.iter_gzip(chunks)), GZIP_WBITS)
+    assert page == generate.generate_html_bytes('Heading <&>', links, open_in_new_tab, theme, minify)
+
+
+@pytest.mark.parametrize('theme', generate.THEMES.names())
+@pytest.mark.parametrize('minify', [False, True])
+def test_brotli_stream_matches_page(theme, minify):
+    brotli = pytest.importorskip('brotli')
+    links = sample_links(generate.LINK_BATCH_SIZE + 1)
+    chunks = generate.iter_html_page('Heading', links, True, theme, minify=minify)
+    page = brotli.decompress(b''.join(generate.iter_brotli(chunks)))
+    assert page == generate.generate_html_bytes('Heading', links, True, theme, minify)
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('deflate', None),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('gzip; q=0.8, br;q=0.9', 'br'),
+    ('gzip;q=0', None),
+    ('gzip;q=0, br;q=0', None),
+    ('gzip;q=bogus', None),
+    ('*', 'br'),
+    ('*;q=0', None),
+    ('br;q=0, *', 'gzip'),
+    ('identity', None),
+    ('identity, gzip;q=0.5', None),
+    ('gzip, identity;q=0.5', 'gzip'),
+])
+def test_choose_encoding(monkeypatch, header, expected):
+    monkeypatch.setattr(generate, 'brotli', object())
+    assert generate.choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('br', None),
+    ('br, gzip;q=0.1', 'gzip'),
+    ('*', 'gzip'),
+])
+def test_choose_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(generate, 'brotli', None)
+    assert generate.choose_encoding(header) == expected
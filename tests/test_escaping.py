@@ -0,0 +1,56 @@
+"""Bulk escaping of link fields must match escaping every field on its own."""
+import html
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+TARGET_ATTRS = [' target="_blank" rel="noopener noreferrer"', '']
+
+
+def per_field_render(theme, links, start, target_attr):
+    """Render links straight from the pack's link.html, one html.escape per field."""
+    with open(os.path.join(generate.THEMES_DIR, theme, 'link.html'), encoding='utf-8') as f:
+        source = f.read()
+    source = source[:-1] if source.endswith('\n') else source
+    return '\n'.join(
+        source.format(url=html.escape(link['url']), text=html.escape(link['text']), number=number, target_attr=target_attr)
+        for number, link in enumerate(links, start + 1)
+    )
+
+
+def sample_links(count):
+    texts = ['Plain link', '<b>"Tom & Jerry"</b>', "it's", 'Grüße 🚀 链接', '&amp; already', '{braces}']
+    urls = ['https://example.com/', 'https://example.com/?a=1&b=<2>', "javascript:alert('x')", 'https://例子.example/']
+    return [{'text': f'{texts[i % len(texts)]} {i}', 'url': f'{urls[i % len(urls)]}{i}'} for i in range(count)]
+
+
+@pytest.mark.parametrize('theme', generate.THEMES.names())
+@pytest.mark.parametrize('target_attr', TARGET_ATTRS)
+@pytest.mark.parametrize('start', [0, 41, generate.LINK_BATCH_SIZE])
+@pytest.mark.parametrize('links', [
+    sample_links(200),
+    sample_links(1),
+    # A field containing the separator forces the per-field fallback
+    [{'text': 'a\0b', 'url': '<\0>'}, {'text': '&', 'url': '"'}],
+    [{'text': '\0', 'url': '\0'}],
+], ids=['mixed', 'single', 'separator', 'only-separator'])
+def test_bulk_escaping_matches_per_field(theme, target_attr, start, links):
+    expected = per_field_render(theme, links, start, target_attr).encode('utf-8')
+    actual = generate.THEMES.get(theme).render_links(links, start, target_attr).encode('utf-8')
+    assert actual == expected
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [''],
+    ['', ''],
+    ['<a>', '&', '"\'', 'plain'],
+    ['x\0y', '<'],
+])
+def test_escape_all(values):
+    assert generate.escape_all(values) == [html.escape(value) for value in values]
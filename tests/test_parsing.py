@@ -0,0 +1,121 @@
+"""Incremental request parsing must match json.loads at every chunk boundary."""
+import io
+import json
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import generate
+
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64, generate.READ_CHUNK_SIZE]
+
+
+def reader(body, chunk_size):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return generate.JSONStreamReader(io.BytesIO(body), len(body), chunk_size)
+
+
+def parse(body, chunk_size):
+    return generate.read_page_request(reader(body, chunk_size))
+
+
+BODIES = [
+    # Multi-byte UTF-8 sequences split across chunks
+    '{"heading": "Grüße 🚀 链接", "links": [{"text": "Ссылка 🚀", "url": "https://例子.example/ü"}]}',
+    # Numbers that a chunk boundary could cut short
+    '{"links": [{"text": "a", "url": "b", "n": 1234567890}], "count": 98765.4321e-3, "big": 12345678901234567890}',
+    '{"heading":"h","links":[{"text":"a","url":"b"},{"text":"c","url":"d"}],"openInNewTab":false}',
+    # Braces and separators inside strings around element boundaries
+    '{"links": [{"text": "}, {", "url": "]}"}, {"text": "a}", "url": "{\\"x\\": 1}"}, {"text": "}", "url": "}"}]}',
+    '{"links": [{"text": "x", "url": "y", "extra": {"nested": [1, {"a": "}"}]}}, {"text": "z", "url": "w"}], "after": {"k": "}"}}',
+    '  {\n "heading" : "spaced" ,\n "links" : [ { "text" : "a" , "url" : "b" } ,\n { "text" : "c" , "url" : "d" } ] }  ',
+    '{"links": []}',
+    '{}',
+]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('body', BODIES)
+def test_matches_json_loads(body, chunk_size):
+    assert parse(body, chunk_size) == json.loads(body)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, generate.READ_CHUNK_SIZE])
+def test_many_links(chunk_size):
+    links = [{'text': f'Link }}, {{ {i} 🚀', 'url': f'https://example.com/{i}?q="{i}"'} for i in range(2000)]
+    body = json.dumps({'heading': 'h', 'links': links}, ensure_ascii=False)
+    assert parse(body, chunk_size)['links'] == links
+
+
+def test_links_share_key_strings():
+    links = [{'text': f'Link {i}', 'url': f'u{i}'} for i in range(100)]
+    parsed = parse(json.dumps({'links': links}), generate.READ_CHUNK_SIZE)['links']
+    keys = {id(key) for link in parsed for key in link}
+    assert len(keys) == 2
+
+
+def test_long_string_across_chunks():
+    heading = 'x' * 100000 + 'é'
+    assert parse(json.dumps({'heading': heading, 'links': []}, ensure_ascii=False), 64)['heading'] == heading
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('body', [
+    '{"heading": "h" "links": []}',
+    '{"links": [{"text": "a", "url": "b"} {"text": "c"}]}',
+    '{"links": [{"text": "a", "url": "b"},]}',
+    '{"heading": "ü🚀", "links": [{"text": "é", "url": "b"}, nope]}',
+    '{"links": [{"text": "a", "url": "b"}]} extra',
+    '{"heading": "unterminated',
+])
+def test_error_positions(body, chunk_size):
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(body)
+    with pytest.raises(ValueError) as actual:
+        parse(body, chunk_size)
+    position = int(re.search(r'at char (\d+) of the request body', str(actual.value)).group(1))
+    assert position == expected.value.pos
+
+
+def test_body_ending_early():
+    body = b'{"links": [{"text": "a", "url": "b"}]}'
+    stream = generate.JSONStreamReader(io.BytesIO(body[:-5]), len(body), 4)
+    with pytest.raises(ValueError, match='ended early'):
+        generate.read_page_request(stream)
+
+
+def test_too_many_links():
+    body = json.dumps({'links': [{'text': 'a', 'url': 'b'}] * 5})
+    with pytest.raises(generate.PayloadTooLarge):
+        generate.read_page_request(reader(body, 8), max_links=4)
+
+
+@pytest.mark.parametrize('body, message', [
+    ('{"heading": "", "links": [{"text": "", "url": "b"}]}', 'Heading is required'),
+    ('{"links": [{"text": "", "url": "b"}], "heading": " "}', 'Heading is required'),
+    ('{"heading": "h", "links": [{"text": "a", "url": "b"}, {"text": "c", "url": ""}]}', 'Link 2 is missing URL'),
+])
+def test_validation_order(body, message):
+    with pytest.raises(ValueError, match=message):
+        generate.read_page_options(parse(body, 5))
+
+
+@pytest.mark.parametrize('field', ['minify', 'openInNewTab'])
+@pytest.mark.parametrize('value', ['false', 'true', 0, 1, None])
+def test_flags_must_be_booleans(field, value):
+    data = {'heading': 'h', 'links': [{'text': 'a', 'url': 'b'}], field: value}
+    with pytest.raises(ValueError, match=f'{field} must be true or false'):
+        generate.read_page_options(data)
+
+
+def test_flag_defaults():
+    options = generate.read_page_options({'heading': 'h', 'links': [{'text': 'a', 'url': 'b'}]})
+    assert options[2:] == (True, 'default', False)
+    options = generate.read_page_options(parse('{"heading": "h", "links": [{"text": "a", "url": "b"}], '
+                                               '"openInNewTab": false, "minify": true}', 5))
+    assert options[2:] == (False, 'default', True)